@@ -61,7 +61,8 @@ end
 
 local function to_str(v)
   local t = type(v)
-  if v == nil then return '' end
+  -- JSON null (missing DataFrame cells) decodes to vim.NIL; show it blank.
+  if v == nil or v == vim.NIL then return '' end
   if t == 'string' then return v end
   if t == 'number' or t == 'boolean' then return tostring(v) end
   return tostring(v)
@@ -678,6 +678,16 @@ local function encode_json(value)
   return encoded
 end
 
+local py_str_escapes = { ['\\'] = '\\\\', ["'"] = "\\'", ['\n'] = '\\n', ['\r'] = '\\r', ['\t'] = '\\t' }
+
+-- Quote text as a single-quoted Python str literal, escaping like repr().
+local function py_str_literal(text)
+  local body = text:gsub("[\\'%c]", function(c)
+    return py_str_escapes[c] or string.format('\\x%02x', c:byte())
+  end)
+  return "'" .. body .. "'"
+end
+
 function M._sync_var_filters()
   if not M.is_open() then return end
   M._send_helpers_if_needed()
@@ -694,12 +704,14 @@ function M._sync_var_filters()
   if M._last_filters_signature == signature then
     return
   end
-  local template = py_module.source('sync_filters.py')
-  local script = template
-    :gsub('__NAMES_JSON__', names_json)
-    :gsub('__TYPES_JSON__', types_json)
-    :gsub('__MAX_REPR__', tostring(max_repr))
-    :gsub('__ENABLE_LOGS__', enable_logs and 'True' or 'False')
+  local args_json = table.concat({
+    '{"names":', names_json,
+    ',"types":', types_json,
+    ',"max_repr":', tostring(max_repr),
+    ',"enable_logs":', enable_logs and 'true' or 'false',
+    '}',
+  })
+  local script = '__mi_sync_args = ' .. py_str_literal(args_json) .. '\n' .. py_module.source('sync_filters.py')
   local function fallback()
     local payload = utils.send_exec_block(script)
     term_send(payload)
@@ -5,6 +5,7 @@ import io
 import json
 import os
 import socket
+import struct
 import sys
 import threading
 import time
@@ -25,6 +26,16 @@ _BREAKPOINT_STATE = {"path": None, "signature": None, "data": {}}
 _BREAKPOINT_STATE_LOCK = threading.Lock()
 _BREAKPOINT_WATCHER_STARTED = False
 
+# Debug preview frames: 4-byte big-endian length followed by a JSON body.
+_PREVIEW_FRAME_HEADER = struct.Struct(">I")
+# Requests are a few short JSON fields; anything larger is refused unread.
+_PREVIEW_MAX_REQUEST = 1 << 20
+# Compact, non-ASCII-escaping encoder shared by the backend-facing helpers.
+_MI_JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+# Last variable listing keyed by (namespace token, max_repr); any client asking
+# again before the next cell gets it without walking the namespace.
+_MI_VARS_MEMO = {"key": None, "vars": None}
+
 
 def _debug_baseline_snapshot(namespace):
     if not isinstance(namespace, dict):
@@ -308,7 +319,7 @@ class _DebugPreviewContext:
             )
         )
 
-    def compute(self, name, rows=None, cols=None, row_offset=None, col_offset=None):
+    def compute(self, name, rows=None, cols=None, row_offset=None, col_offset=None, packed=False):
         effective_rows = _coerce_int(rows, self.rows)
         effective_cols = _coerce_int(cols, self.cols)
         if effective_rows <= 0:
@@ -354,6 +365,7 @@ class _DebugPreviewContext:
                 max_cols=effective_cols,
                 row_offset=row_base,
                 col_offset=col_base,
+                packed=packed,
             )
         except Exception as exc:
             payload = {"name": name, "error": f"preview error: {exc}"}
@@ -371,23 +383,74 @@ class _DebugPreviewServer:
         self._context = context
         self._socket = None
         self._thread = None
-        self._port = None
+        self._address = None
+        self._lock = threading.Lock()
 
     @property
     def context(self):
         return self._context
 
     def ensure_running(self):
-        if self._port:
-            return self._port
+        """Start the server once; return ``unix:<name>`` or a TCP port."""
+        if self._address:
+            return self._address
+        server, address = self._bind_unix()
+        if server is None:
+            server, address = self._bind_tcp()
+        if server is None:
+            return None
+        self._socket = server
+        thread = threading.Thread(
+            target=self._serve, name="ipybridge-debug-preview", daemon=True
+        )
+        thread.start()
+        self._thread = thread
+        self._address = address
+        _ipy_log_debug(f"debug preview server listening address={address}")
+        return address
+
+    @staticmethod
+    def _size_buffers(server):
+        try:
+            # Accepted connections inherit these; previews go out in one send.
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+
+    def _bind_unix(self):
+        # Linux abstract namespace skips the IP stack and leaves no file behind.
+        if not sys.platform.startswith("linux") or not hasattr(socket, "AF_UNIX"):
+            return None, None
+        name = f"ipybridge_{os.getpid()}_{os.urandom(6).hex()}"
+        try:
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        except Exception as exc:
+            _ipy_log_debug(f"debug preview unix socket unavailable: {exc}")
+            return None, None
+        try:
+            self._size_buffers(server)
+            server.bind("\0" + name)
+            server.listen(5)
+        except Exception as exc:
+            _ipy_log_debug(f"debug preview unix bind failed: {exc}")
+            try:
+                server.close()
+            except Exception:
+                pass
+            return None, None
+        return server, f"unix:{name}"
+
+    def _bind_tcp(self):
         try:
             server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._size_buffers(server)
             server.bind(("127.0.0.1", 0))
             server.listen(5)
         except Exception as exc:
             _ipy_log_debug(f"debug preview server start failed: {exc}")
-            return None
+            return None, None
         port = server.getsockname()[1]
         if not port or port <= 0:
             _ipy_log_debug("debug preview server yielded invalid port")
@@ -395,17 +458,8 @@ class _DebugPreviewServer:
                 server.close()
             except Exception:
                 pass
-            self._socket = None
-            return None
-        self._socket = server
-        thread = threading.Thread(
-            target=self._serve, name="ipybridge-debug-preview", daemon=True
-        )
-        thread.start()
-        self._thread = thread
-        self._port = port
-        _ipy_log_debug(f"debug preview server listening port={port}")
-        return port
+            return None, None
+        return server, port
 
     def _serve(self):
         server = self._socket
@@ -418,34 +472,74 @@ class _DebugPreviewServer:
                 _ipy_log_debug(f"debug preview server accept failed: {exc}")
                 break
             try:
-                request = self._read_request(conn)
-                if request is None:
-                    continue
-                payload = self._build_response(request)
-                conn.sendall(payload)
+                threading.Thread(
+                    target=self._serve_connection,
+                    args=(conn,),
+                    name="ipybridge-debug-preview-conn",
+                    daemon=True,
+                ).start()
             except Exception as exc:
                 _ipy_log_debug(f"debug preview server error: {exc}")
-            finally:
                 try:
                     conn.close()
                 except Exception:
                     pass
 
-    def _read_request(self, conn):
-        data = b""
-        while True:
-            chunk = conn.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if b"\n" in chunk:
-                break
-        if not data:
-            return None
+    def _serve_connection(self, conn):
+        # Clients keep one connection open and send length-prefixed frames.
+        if conn.family == socket.AF_INET:
+            try:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+        buf = bytearray(4096)
         try:
-            return json.loads(data.decode("utf-8").strip())
+            while True:
+                request, buf = self._read_request(conn, buf)
+                if request is None:
+                    break
+                with self._lock:
+                    payload = self._build_response(request)
+                conn.sendall(payload)
+                if isinstance(request, dict) and request.get("_close"):
+                    break
         except Exception as exc:
-            return {"_error": f"decode error: {exc}"}
+            _ipy_log_debug(f"debug preview server error: {exc}")
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _recv_exact(conn, view):
+        filled = 0
+        size = len(view)
+        while filled < size:
+            count = conn.recv_into(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    def _read_request(self, conn, buf):
+        header_size = _PREVIEW_FRAME_HEADER.size
+        if not self._recv_exact(conn, memoryview(buf)[:header_size]):
+            return None, buf
+        (length,) = _PREVIEW_FRAME_HEADER.unpack_from(buf)
+        if length > _PREVIEW_MAX_REQUEST:
+            # The body is never read, so the stream cannot be resynced: answer
+            # and let the caller drop the connection.
+            return {"_error": f"request too large: {length} bytes", "_close": True}, buf
+        if length > len(buf):
+            buf = bytearray(length)
+        view = memoryview(buf)[:length]
+        if not self._recv_exact(conn, view):
+            return None, buf
+        try:
+            return json.loads(bytes(view).decode("utf-8")), buf
+        except Exception as exc:
+            return {"_error": f"decode error: {exc}"}, buf
 
     def _build_response(self, request):
         err = request.get("_error") if isinstance(request, dict) else None
@@ -457,9 +551,11 @@ class _DebugPreviewServer:
             cols = request.get("max_cols")
             row_offset = request.get("row_offset")
             col_offset = request.get("col_offset")
-            data = self._context.compute(name, rows, cols, row_offset, col_offset)
+            packed = bool(request.get("packed"))
+            data = self._context.compute(name, rows, cols, row_offset, col_offset, packed)
             result = {"ok": True, "data": data}
-        return json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+        body = _MI_JSON_ENCODE(result).encode("utf-8")
+        return _PREVIEW_FRAME_HEADER.pack(len(body)) + body
 
     def compute(self, name, rows=None, cols=None, row_offset=None, col_offset=None):
         return self._context.compute(name, rows, cols, row_offset, col_offset)
@@ -472,9 +568,10 @@ MODULE_B64 = "__MODULE_B64__"
 
 def _myipy_bootstrap_module():
     """Ensure ipybridge_ns is loaded into the kernel."""
-    src = base64.b64decode(MODULE_B64).decode("utf-8")
     mod = sys.modules.get("ipybridge_ns")
     if mod is None:
+        # Decode only on first load; re-running the prelude reuses the module.
+        src = base64.b64decode(MODULE_B64).decode("utf-8")
         mod = types.ModuleType("ipybridge_ns")
         exec(compile(src, "<ipybridge_ns>", "exec"), mod.__dict__)
         sys.modules["ipybridge_ns"] = mod
@@ -485,8 +582,11 @@ _ipy_mod = _myipy_bootstrap_module()
 from ipybridge_ns import (
     collect_namespace as _ipy_collect_namespace,
     get_var_filters as _ipy_get_var_filters,
+    install_version_hook as _ipy_install_version_hook,
     list_variables as _ipy_list_variables,
     log_debug as _ipy_log_debug,
+    mark_helper_execution as _ipy_mark_helper_execution,
+    namespace_token as _ipy_namespace_token,
     preview_data as _ipy_preview_data,
     set_debug_logging as _ipy_set_debug_logging,
     set_var_filters as _ipy_set_var_filters,
@@ -587,9 +687,10 @@ MODULE_B64 = "__MODULE_B64__"
 
 def _myipy_bootstrap_module():
     """Ensure ipybridge_ns is loaded into the kernel."""
-    src = base64.b64decode(MODULE_B64).decode("utf-8")
     mod = sys.modules.get("ipybridge_ns")
     if mod is None:
+        # Decode only on first load; re-running the prelude reuses the module.
+        src = base64.b64decode(MODULE_B64).decode("utf-8")
         mod = types.ModuleType("ipybridge_ns")
         exec(compile(src, "<ipybridge_ns>", "exec"), mod.__dict__)
         sys.modules["ipybridge_ns"] = mod
@@ -600,8 +701,11 @@ _ipy_mod = _myipy_bootstrap_module()
 from ipybridge_ns import (
     collect_namespace as _ipy_collect_namespace,
     get_var_filters as _ipy_get_var_filters,
+    install_version_hook as _ipy_install_version_hook,
     list_variables as _ipy_list_variables,
     log_debug as _ipy_log_debug,
+    mark_helper_execution as _ipy_mark_helper_execution,
+    namespace_token as _ipy_namespace_token,
     preview_data as _ipy_preview_data,
     set_debug_logging as _ipy_set_debug_logging,
     set_var_filters as _ipy_set_var_filters,
@@ -877,6 +981,7 @@ def _myipy_emit_debug_vars(frame=None):
 
 
 def __mi_debug_preview(name, max_rows=50, max_cols=20, row_offset=0, col_offset=0):
+    _ipy_mark_helper_execution()
     rows = _coerce_int(max_rows, _PREVIEW_LIMITS.get("rows") or 30)
     cols = _coerce_int(max_cols, _PREVIEW_LIMITS.get("cols") or 20)
     _PREVIEW_LIMITS["rows"] = rows
@@ -888,14 +993,18 @@ def __mi_debug_preview(name, max_rows=50, max_cols=20, row_offset=0, col_offset=
     if col_off < 0:
         col_off = 0
     data = _DEBUG_PREVIEW.compute(name, rows, cols, row_off, col_off)
-    print(json.dumps(data, ensure_ascii=False))
+    print(_MI_JSON_ENCODE(data))
     _myipy_purge_last_history()
 
 
 def __mi_debug_server_info():
-    port = _DEBUG_PREVIEW.ensure_running()
-    payload = {"port": int(port) if port else None}
-    print(json.dumps(payload, ensure_ascii=False))
+    _ipy_mark_helper_execution()
+    address = _DEBUG_PREVIEW.ensure_running()
+    payload = {
+        "port": address if isinstance(address, int) else None,
+        "address": str(address) if address else None,
+    }
+    print(_MI_JSON_ENCODE(payload))
     _myipy_purge_last_history()
 
 
@@ -903,21 +1012,30 @@ def __mi_set_filters(names=None, types=None, max_repr=None):
     _myipy_sync_var_filters(names, types, max_repr)
 
 
-def __mi_list_vars(max_repr=120, hide_names=None, hide_types=None):
+def _myipy_vars_since_payload(token=None, max_repr=120, hide_names=None, hide_types=None):
     __mi_set_filters(hide_names, hide_types, max_repr)
     filters = _ipy_get_var_filters()
     namespace = _myipy_current_namespace()
+    current = _ipy_namespace_token(namespace)
+    if current is not None and current == token:
+        return {"token": current, "unchanged": True}
+    limit = filters.get("max_repr") or max_repr or 120
+    key = (current, limit)
+    if current is not None and _MI_VARS_MEMO["key"] == key:
+        return {"token": current, "vars": _MI_VARS_MEMO["vars"]}
     data = _ipy_list_variables(
         namespace=namespace,
-        max_repr=filters.get("max_repr") or max_repr or 120,
+        max_repr=limit,
         hide_names=filters.get("names"),
         hide_types=filters.get("types"),
     )
-    print(json.dumps(data, ensure_ascii=False))
-    _myipy_purge_last_history()
+    if current is not None:
+        _MI_VARS_MEMO["key"] = key
+        _MI_VARS_MEMO["vars"] = data
+    return {"token": current, "vars": data}
 
 
-def __mi_preview(name, max_rows=50, max_cols=20, row_offset=0, col_offset=0):
+def _myipy_preview_payload(name, max_rows=50, max_cols=20, row_offset=0, col_offset=0):
     rows = _coerce_int(max_rows, _PREVIEW_LIMITS.get("rows") or 30)
     cols = _coerce_int(max_cols, _PREVIEW_LIMITS.get("cols") or 20)
     _PREVIEW_LIMITS["rows"] = rows
@@ -929,18 +1047,82 @@ def __mi_preview(name, max_rows=50, max_cols=20, row_offset=0, col_offset=0):
     if col_off < 0:
         col_off = 0
     namespace = _myipy_current_namespace()
-    data = _ipy_preview_data(
+    return _ipy_preview_data(
         name,
         namespace=namespace,
         max_rows=rows,
         max_cols=cols,
         row_offset=row_off,
         col_offset=col_off,
+        packed=True,
     )
-    print(json.dumps(data, ensure_ascii=False))
-    _myipy_purge_last_history()
 
 
+def _myipy_json_finite(value):
+    """Return True when ``value`` holds no NaN/inf floats."""
+    if isinstance(value, float):
+        return value - value == 0.0
+    if isinstance(value, dict):
+        return all(_myipy_json_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(_myipy_json_finite(item) for item in value)
+    return True
+
+
+class _MyipyReply:
+    """Carry a helper reply to the backend as ``application/json``.
+
+    The payload then travels inside the execute reply itself instead of
+    being encoded to text first. Jupyter's message packer rejects NaN/inf,
+    so such payloads fall back to JSON text in ``text/plain``.
+    """
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def _repr_mimebundle_(self, include=None, exclude=None):
+        if _myipy_json_finite(self.payload):
+            # An empty text/plain keeps IPython from repr()-ing the payload.
+            return {"application/json": self.payload, "text/plain": ""}
+        return {"text/plain": repr(_MI_JSON_ENCODE(self.payload))}
+
+
+def __mi_request(text):
+    """Answer a JSON-encoded vars/preview request.
+
+    The backend evaluates this as a user expression behind a silent
+    ``_ipy_mark_helper_execution()`` cell, so the cell never changes between
+    requests and the reply skips stdout and history entirely.
+    """
+    request = json.loads(text)
+    op = request.get("op")
+    if op == "vars":
+        payload = _myipy_vars_since_payload(
+            request.get("token"),
+            request.get("max_repr", 120),
+            request.get("hide_names"),
+            request.get("hide_types"),
+        )
+    elif op == "preview":
+        payload = _myipy_preview_payload(
+            request.get("name") or "",
+            request.get("max_rows", 50),
+            request.get("max_cols", 20),
+            request.get("row_offset", 0),
+            request.get("col_offset", 0),
+        )
+    else:
+        raise ValueError(f"unknown request op: {op!r}")
+    return _MyipyReply(payload)
+
+
+try:
+    _ipy_install_version_hook(get_ipython())
+except NameError:
+    pass
+
 env_bp_path = os.environ.get(_BREAKPOINT_FILE_ENV)
 if env_bp_path:
     _myipy_register_breakpoints_file(env_bp_path)
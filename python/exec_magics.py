@@ -25,9 +25,10 @@ except NameError:  # pragma: no cover
     import types
 
     def _myipy_bootstrap_module():
-        src = base64.b64decode(MODULE_B64).decode("utf-8")
         mod = sys.modules.get("ipybridge_ns")
         if mod is None:
+            # Decode only on first load; re-running the prelude reuses the module.
+            src = base64.b64decode(MODULE_B64).decode("utf-8")
             mod = types.ModuleType("ipybridge_ns")
             exec(compile(src, "<ipybridge_ns>", "exec"), mod.__dict__)
             sys.modules["ipybridge_ns"] = mod
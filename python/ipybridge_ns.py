@@ -2,16 +2,21 @@
 
 from __future__ import annotations
 
+import base64
 import dataclasses
 import sys
 import types
-from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+import weakref
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
 
 __all__ = [
     "collect_namespace",
     "get_var_filters",
+    "install_version_hook",
     "list_variables",
     "log_debug",
+    "mark_helper_execution",
+    "namespace_token",
     "preview_data",
     "resolve_path",
     "set_debug_logging",
@@ -19,6 +24,10 @@ __all__ = [
 ]
 
 _EXCLUDED_NAMES = {"In", "Out", "exit", "quit", "get_ipython"}
+# DataFrames above this many cells show their columns in the variable table
+# instead of a repr; pandas formatting costs milliseconds per frame.
+_LISTING_REPR_ELEMENTS = 64
+_LISTING_REPR_COLS = 8
 
 _SENTINEL = object()
 _NUMPY: Any = _SENTINEL
@@ -26,6 +35,17 @@ _PANDAS: Any = _SENTINEL
 _CTYPES: Any = _SENTINEL
 _DEBUG_LOG = False
 _FILTERS = {"names": None, "types": None, "max_repr": 120}
+# (exact names, prefixes) per hide-pattern tuple; see _compile_patterns().
+_PATTERN_CACHE: Dict[tuple, Tuple[frozenset, tuple]] = {}
+# Structure type -> _fields_ tuple; weak so redefined notebook classes can go.
+_CTYPES_FIELDS: "weakref.WeakKeyDictionary[Any, tuple]" = weakref.WeakKeyDictionary()
+# id(DataFrame) -> (weakref, columns, dtypes, dtype str, column names); frames
+# are unhashable, so entries are keyed by id and dropped when the frame dies.
+_FRAME_META: Dict[int, tuple] = {}
+# Primitive ctypes element type -> numpy dtype code; filled by _ctype_np_codes().
+_CTYPE_TO_NP: Dict[Any, str] = {}
+# Bumped after every execution except read-only helper calls; see namespace_token().
+_NS_VERSION = {"value": 0, "quiet": False, "hooked": False}
 
 
 def _lazy_import(holder: str):
@@ -105,6 +125,45 @@ def get_var_filters() -> Dict[str, Any]:
     }
 
 
+def install_version_hook(shell: Any) -> bool:
+    """Count executions on ``shell`` so unchanged namespaces can be detected."""
+    if _NS_VERSION["hooked"]:
+        return True
+    try:
+        shell.events.register("post_execute", _on_post_execute)
+    except Exception:
+        return False
+    _NS_VERSION["hooked"] = True
+    return True
+
+
+def _on_post_execute() -> None:
+    if _NS_VERSION["quiet"]:
+        _NS_VERSION["quiet"] = False
+        return
+    _NS_VERSION["value"] += 1
+
+
+def mark_helper_execution() -> None:
+    """Keep the running cell (a read-only helper call) from bumping the version."""
+    if _NS_VERSION["hooked"]:
+        _NS_VERSION["quiet"] = True
+
+
+def namespace_token(namespace: Mapping[str, Any]) -> Optional[str]:
+    """Return a token that changes whenever a variable listing could differ.
+
+    Combines the execution counter, the set of names (threads may add or
+    remove globals between cells) and the active filters. Returns None when
+    no execution hook is installed, so callers never treat results as cached.
+    """
+    if not _NS_VERSION["hooked"]:
+        return None
+    names_hash = hash(frozenset(namespace))
+    filters_hash = hash(repr(sorted(_FILTERS.items())))
+    return f"{_NS_VERSION['value']}:{names_hash & 0xFFFFFFFF:x}:{filters_hash & 0xFFFFFFFF:x}"
+
+
 def collect_namespace(globals_dict: Optional[Mapping[str, Any]] = None,
                       locals_dict: Optional[Mapping[str, Any]] = None,
                       extra: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
@@ -119,24 +178,49 @@ def collect_namespace(globals_dict: Optional[Mapping[str, Any]] = None,
     return namespace
 
 
-def _match(name: str, patterns: Optional[Iterable[str]]) -> bool:
+def _compile_patterns(patterns: Optional[Iterable[str]]) -> Optional[Tuple[frozenset, tuple]]:
+    """Split hide patterns into exact names and ``prefix*`` prefixes.
+
+    The split is cached per pattern list, since the same filters arrive with
+    every listing.
+    """
     if not patterns:
-        return False
+        return None
     try:
-        for pattern in patterns:
-            if not isinstance(pattern, str):
-                continue
-            if pattern.endswith("*"):
-                if name.startswith(pattern[:-1]):
-                    return True
-            elif name == pattern:
-                return True
-    except Exception:
+        # Non-str entries (e.g. nested lists from JSON) are skipped, which also
+        # keeps the key hashable.
+        key = tuple(pattern for pattern in patterns if isinstance(pattern, str))
+    except TypeError:
+        return None
+    compiled = _PATTERN_CACHE.get(key)
+    if compiled is None:
+        compiled = (
+            frozenset(pattern for pattern in key if not pattern.endswith("*")),
+            tuple(pattern[:-1] for pattern in key if pattern.endswith("*")),
+        )
+        if len(_PATTERN_CACHE) >= 32:
+            _PATTERN_CACHE.clear()
+        _PATTERN_CACHE[key] = compiled
+    return compiled
+
+
+def _match(name: str, compiled: Optional[Tuple[frozenset, tuple]]) -> bool:
+    if compiled is None:
         return False
-    return False
+    exact, prefixes = compiled
+    return name in exact or (bool(prefixes) and name.startswith(prefixes))
 
 
 def _safe_repr(value: Any, limit: int) -> str:
+    if type(value) in (str, bytes) and len(value) > limit:
+        # Each character yields at least one repr character, so the head
+        # alone fills the limit; no need to escape the whole string. repr()
+        # picks double quotes when there is a ' but no ", so the head is only
+        # used when it makes the same choice as the full value.
+        head = value[:limit]
+        single, double = ("'", '"') if type(value) is str else (b"'", b'"')
+        if (single in head and double not in head) == (single in value and double not in value):
+            return repr(head)[:limit] + "..."
     try:
         rep = repr(value)
     except Exception:
@@ -146,6 +230,20 @@ def _safe_repr(value: Any, limit: int) -> str:
     return rep
 
 
+def _listing_repr(value: Any, kind: Optional[str], limit: int) -> str:
+    """Repr for the variable table; large DataFrames only list their columns."""
+    if kind == "dataframe":
+        try:
+            if value.size > _LISTING_REPR_ELEMENTS:
+                columns = list(value.columns[:_LISTING_REPR_COLS])
+                more = ", ..." if value.shape[1] > _LISTING_REPR_COLS else ""
+                rep = "columns: [" + ", ".join(repr(col) for col in columns) + more + "]"
+                return rep[:limit] + "..." if len(rep) > limit else rep
+        except Exception:
+            pass
+    return _safe_repr(value, limit)
+
+
 def _shape(value: Any) -> Optional[list]:
     try:
         np_mod = _lazy_import("numpy")
@@ -161,6 +259,29 @@ def _shape(value: Any) -> Optional[list]:
     return None
 
 
+def _frame_meta(frame: Any) -> Tuple[str, List[str]]:
+    """Return the dtype string and column names of a DataFrame, cached per frame."""
+    key = id(frame)
+    columns = frame.columns
+    dtypes = frame.dtypes
+    entry = _FRAME_META.get(key)
+    if entry is not None and entry[0]() is frame and entry[1] is columns and entry[2].equals(dtypes):
+        return entry[3], entry[4]
+
+    def _drop(ref: Any, key: int = key) -> None:
+        current = _FRAME_META.get(key)
+        if current is not None and current[0] is ref:
+            del _FRAME_META[key]
+
+    dtype_str = str(dtypes.to_dict())
+    names = [str(c) for c in columns.to_list()]
+    try:
+        _FRAME_META[key] = (weakref.ref(frame, _drop), columns, dtypes, dtype_str, names)
+    except TypeError:
+        pass
+    return dtype_str, names
+
+
 def _value_kind(value: Any) -> Tuple[Optional[str], Optional[str]]:
     kind: Optional[str] = None
     dtype: Optional[str] = None
@@ -177,7 +298,7 @@ def _value_kind(value: Any) -> Tuple[Optional[str], Optional[str]]:
         if pd_mod is not None and isinstance(value, pd_mod.DataFrame):  # type: ignore[attr-defined]
             kind = "dataframe"
             try:
-                dtype = str(value.dtypes.to_dict())
+                dtype = _frame_meta(value)[0]
             except Exception:
                 dtype = None
             return kind, dtype
@@ -212,7 +333,7 @@ def _describe_value(value: Any, max_repr: int) -> Dict[str, Any]:
         "type": value_type,
         "shape": _shape(value),
         "dtype": dtype,
-        "repr": _safe_repr(value, max_repr),
+        "repr": _listing_repr(value, kind, max_repr),
     }
     if kind:
         description["kind"] = kind
@@ -226,8 +347,8 @@ def list_variables(namespace: Optional[Mapping[str, Any]] = None,
     """List user variables from the provided namespace."""
     max_repr_val = max_repr or _FILTERS["max_repr"]
     ns = namespace or {}
-    hidden_names = hide_names if hide_names is not None else _FILTERS["names"]
-    hidden_types = hide_types if hide_types is not None else _FILTERS["types"]
+    hidden_names = _compile_patterns(hide_names if hide_names is not None else _FILTERS["names"])
+    hidden_types = _compile_patterns(hide_types if hide_types is not None else _FILTERS["types"])
     out: Dict[str, Dict[str, Any]] = {}
     log_debug(f"listing variables from namespace size={len(ns)}")
     for name, value in ns.items():
@@ -368,51 +489,106 @@ def _dataclass_preview(obj: Any, max_cols: int) -> Dict[str, Any]:
     }
 
 
-def _ctypes_structure_preview(obj: Any, max_cols: int) -> Dict[str, Any]:
-    ctypes_mod = _lazy_import("ctypes")
-    assert ctypes_mod is not None
+def _ctype_name(t: Any) -> str:
+    try:
+        return getattr(t, "__name__", str(t))
+    except Exception:
+        return str(t)
 
-    def _ctype_name(t: Any) -> str:
+
+def _ctypes_fields(struct_type: Any) -> tuple:
+    """Return ``struct_type._fields_`` as a tuple, cached per Structure type."""
+    try:
+        return _CTYPES_FIELDS[struct_type]
+    except (KeyError, TypeError):
+        pass
+    fields = tuple(getattr(struct_type, "_fields_", None) or ())
+    if fields:
         try:
-            return getattr(t, "__name__", str(t))
-        except Exception:
-            return str(t)
+            _CTYPES_FIELDS[struct_type] = fields
+        except TypeError:
+            pass
+    return fields
+
+
+def _ctype_np_codes(ctypes_mod: Any) -> Dict[Any, str]:
+    if not _CTYPE_TO_NP:
+        _CTYPE_TO_NP[ctypes_mod.c_float] = "f4"
+        _CTYPE_TO_NP[ctypes_mod.c_double] = "f8"
+        _CTYPE_TO_NP[ctypes_mod.c_bool] = "?"
+        for signed, unsigned in (
+            (ctypes_mod.c_byte, ctypes_mod.c_ubyte),
+            (ctypes_mod.c_short, ctypes_mod.c_ushort),
+            (ctypes_mod.c_int, ctypes_mod.c_uint),
+            (ctypes_mod.c_long, ctypes_mod.c_ulong),
+            (ctypes_mod.c_longlong, ctypes_mod.c_ulonglong),
+        ):
+            size = ctypes_mod.sizeof(signed)
+            _CTYPE_TO_NP[signed] = f"i{size}"
+            _CTYPE_TO_NP[unsigned] = f"u{size}"
+    return _CTYPE_TO_NP
+
+
+def _ctypes_primitive_values(obj: Any, count: int) -> Optional[list]:
+    """Read the first ``count`` items of a primitive ctypes array through numpy.
+
+    Returns None for element types without a native numpy equivalent (chars,
+    pointers, structures, byte-swapped types) so callers fall back to indexing.
+    """
+    np_mod = _lazy_import("numpy")
+    ctypes_mod = _lazy_import("ctypes")
+    if np_mod is None or ctypes_mod is None:
+        return None
+    code = _ctype_np_codes(ctypes_mod).get(getattr(type(obj), "_type_", None))
+    if code is None:
+        return None
+    if count <= 0:
+        return []
+    try:
+        return np_mod.frombuffer(obj, dtype=code, count=count).tolist()  # type: ignore[attr-defined]
+    except Exception:
+        return None
 
-    def _array_elt_type(array_type: Any) -> Any:
-        return getattr(array_type, "_type_", None)
 
-    def _unbox(value: Any, depth: int = 0) -> Any:
-        if depth > 5:
-            return "<depth limit>"
-        try:
-            if isinstance(value, ctypes_mod.Array):  # type: ignore[attr-defined]
-                result = []
-                length = len(value)
-                limit = max_cols
-                for index in range(min(length, limit)):
-                    result.append(_unbox(value[index], depth + 1))
-                if length > limit:
-                    result.append(f"...(+{length - limit} more)")
-                return result
-            if isinstance(value, ctypes_mod.Structure):  # type: ignore[attr-defined]
-                out = {}
-                for fname, _ in getattr(value, "_fields_", []) or []:
-                    try:
-                        field_value = getattr(value, fname)
-                    except Exception:
-                        field_value = "<unreadable>"
-                    out[str(fname)] = _unbox(field_value, depth + 1)
-                return out
-            if hasattr(value, "value"):
-                return getattr(value, "value")
-            if isinstance(value, (str, int, float, bool)) or value is None:
-                return value
-            return _safe_repr(value, 120)
-        except Exception:
-            return "<error>"
+def _unbox(value: Any, limit: int, ctypes_mod: Any, depth: int = 0) -> Any:
+    """Convert a ctypes value into plain data, showing at most ``limit`` array items."""
+    if depth > 5:
+        return "<depth limit>"
+    try:
+        if isinstance(value, ctypes_mod.Array):  # type: ignore[attr-defined]
+            length = len(value)
+            result = _ctypes_primitive_values(value, min(length, limit))
+            if result is None:
+                result = [_unbox(value[index], limit, ctypes_mod, depth + 1) for index in range(min(length, limit))]
+            if length > limit:
+                result.append(f"...(+{length - limit} more)")
+            return result
+        if isinstance(value, ctypes_mod.Structure):  # type: ignore[attr-defined]
+            out = {}
+            for field in _ctypes_fields(type(value)):
+                fname = field[0]
+                try:
+                    field_value = getattr(value, fname)
+                except Exception:
+                    field_value = "<unreadable>"
+                out[str(fname)] = _unbox(field_value, limit, ctypes_mod, depth + 1)
+            return out
+        if hasattr(value, "value"):
+            return getattr(value, "value")
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        return _safe_repr(value, 120)
+    except Exception:
+        return "<error>"
+
+
+def _ctypes_structure_preview(obj: Any, max_cols: int) -> Dict[str, Any]:
+    ctypes_mod = _lazy_import("ctypes")
+    assert ctypes_mod is not None
 
     fields = []
-    for fname, ftype in getattr(obj, "_fields_", []) or []:
+    for field in _ctypes_fields(type(obj)):
+        fname, ftype = field[0], field[1]
         entry: Dict[str, Any] = {
             "name": str(fname),
             "ctype": _ctype_name(ftype),
@@ -427,14 +603,14 @@ def _ctypes_structure_preview(obj: Any, max_cols: int) -> Dict[str, Any]:
         if isinstance(raw_value, ctypes_mod.Array):  # type: ignore[attr-defined]
             entry["kind"] = "array"
             entry["length"] = int(len(raw_value))
-            entry["values"] = _unbox(raw_value)
-            entry["elem_ctype"] = _ctype_name(_array_elt_type(ftype))
+            entry["values"] = _unbox(raw_value, max_cols, ctypes_mod)
+            entry["elem_ctype"] = _ctype_name(getattr(ftype, "_type_", None))
         elif isinstance(raw_value, ctypes_mod.Structure):  # type: ignore[attr-defined]
             entry["kind"] = "struct"
-            entry["value"] = _unbox(raw_value)
+            entry["value"] = _unbox(raw_value, max_cols, ctypes_mod)
         else:
             entry["kind"] = "scalar"
-            entry["value"] = _unbox(raw_value)
+            entry["value"] = _unbox(raw_value, max_cols, ctypes_mod)
         fields.append(entry)
     return {
         "kind": "ctypes",
@@ -445,14 +621,16 @@ def _ctypes_structure_preview(obj: Any, max_cols: int) -> Dict[str, Any]:
 
 def _ctypes_array_preview(obj: Any, max_rows: int) -> Dict[str, Any]:
     length = int(len(obj))
-    values = []
     limit = max_rows
-    for index in range(min(length, limit)):
-        elem = obj[index]
-        try:
-            values.append(getattr(elem, "value"))
-        except Exception:
-            values.append(elem)
+    values = _ctypes_primitive_values(obj, min(length, limit))
+    if values is None:
+        values = []
+        for index in range(min(length, limit)):
+            elem = obj[index]
+            try:
+                values.append(getattr(elem, "value"))
+            except Exception:
+                values.append(elem)
     if length > limit:
         values.append(f"...(+{length - limit} more)")
     return {
@@ -463,13 +641,79 @@ def _ctypes_array_preview(obj: Any, max_rows: int) -> Dict[str, Any]:
     }
 
 
+def _stringify_cells(values: Any) -> None:
+    """Turn non-numeric cells of a 1-D object array into str, in place."""
+    for index, value in enumerate(values):
+        if value is not None and not isinstance(value, (int, float, bool)):
+            values[index] = str(value)
+
+
+def _dataframe_cells(column: Any) -> list:
+    """Return one column's cells: NA as None, numbers as-is, the rest as str."""
+    values = column.to_numpy(dtype=object, copy=True)
+    mask = column.isna().to_numpy()
+    if mask.any():
+        values[mask] = None
+    if getattr(column.dtype, "kind", "O") not in "fiub":
+        _stringify_cells(values)
+    return values.tolist()
+
+
+def _dataframe_rows(frame: Any) -> list:
+    """Return ``frame`` as row lists, converting and masking it in one pass."""
+    values = frame.to_numpy(dtype=object, copy=True)
+    mask = frame.isna().to_numpy()
+    if mask.any():
+        values[mask] = None
+    for index, dtype in enumerate(frame.dtypes):
+        if getattr(dtype, "kind", "O") not in "fiub":
+            _stringify_cells(values[:, index])
+    return values.tolist()
+
+
+def _packed_numeric(values: Any, np_mod: Any) -> Optional[Dict[str, str]]:
+    """Return ``{"format", "data"}`` for a numeric array, or None otherwise."""
+    dtype = getattr(values, "dtype", None)
+    if np_mod is None or not isinstance(dtype, np_mod.dtype) or dtype.kind not in "fiub":
+        return None
+    values = np_mod.ascontiguousarray(values)
+    return {
+        "format": values.dtype.str,
+        "data": base64.b64encode(values.tobytes()).decode("ascii"),
+    }
+
+
+def _dataframe_packed_columns(frame: Any) -> list:
+    """Encode ``frame`` column by column; numeric columns travel as raw bytes.
+
+    Each entry is either ``{"format": <numpy dtype str>, "data": <base64>}``
+    or ``{"values": [...]}`` holding the same cells ``rows`` would.
+    """
+    np_mod = _lazy_import("numpy")
+    packed = []
+    for _, column in frame.items():
+        entry = None
+        # Extension dtypes (nullable ints, categoricals) keep their plain cells.
+        if np_mod is not None and isinstance(getattr(column, "dtype", None), np_mod.dtype):
+            entry = _packed_numeric(column.to_numpy(), np_mod)
+        packed.append(entry if entry is not None else {"values": _dataframe_cells(column)})
+    return packed
+
+
 def preview_data(name: str,
                  namespace: Optional[Mapping[str, Any]] = None,
                  max_rows: int = 50,
                  max_cols: int = 20,
                  row_offset: int = 0,
-                 col_offset: int = 0) -> Dict[str, Any]:
-    """Build a preview payload for the given variable name."""
+                 col_offset: int = 0,
+                 packed: bool = False) -> Dict[str, Any]:
+    """Build a preview payload for the given variable name.
+
+    With ``packed`` a DataFrame carries ``packed_columns`` instead of
+    ``rows``, and a numeric ndarray slice carries ``packed_values1d`` or
+    ``packed_rows`` (raw bytes plus the slice shape); the backend expands
+    them before they reach the editor.
+    """
     ns = namespace or globals()
     ok, obj, err = resolve_path(name, ns)
     if not ok:
@@ -516,28 +760,20 @@ def preview_data(name: str,
             row_end = row_base + rows_limit if rows_limit > 0 else None
             col_end = col_base + cols_limit if cols_limit > 0 else None
             frame = obj.iloc[row_base:row_end, col_base:col_end]
-            rows = []
-            for row in frame.itertuples(index=False, name=None):
-                converted = []
-                for value in row:
-                    if pd_mod.isna(value):
-                        converted.append(None)
-                    elif isinstance(value, (int, float, bool)):
-                        converted.append(value)
-                    else:
-                        converted.append(str(value))
-                rows.append(converted)
             payload: Dict[str, Any] = {
                 "name": name,
                 "kind": "dataframe",
                 "shape": [int(frame.shape[0]), int(frame.shape[1])],
-                "columns": [str(c) for c in frame.columns.to_list()],
-                "rows": rows,
+                "columns": _frame_meta(obj)[1][col_base:col_end],
                 "row_offset": row_base,
                 "col_offset": col_base,
                 "max_rows": rows_limit,
                 "max_cols": cols_limit,
             }
+            if packed:
+                payload["packed_columns"] = _dataframe_packed_columns(frame)
+            else:
+                payload["rows"] = _dataframe_rows(frame)
             if total_rows is not None and total_cols is not None:
                 payload["total_shape"] = [total_rows, total_cols]
             return payload
@@ -566,7 +802,12 @@ def preview_data(name: str,
                     row_base = max(total_rows - rows_limit, 0)
                 end = row_base + rows_limit if rows_limit > 0 else None
                 info["row_offset"] = row_base
-                info["values1d"] = obj[row_base:end].tolist()
+                window = obj[row_base:end]
+                entry = _packed_numeric(window, np_mod) if packed else None
+                if entry is not None:
+                    info["packed_values1d"] = entry
+                else:
+                    info["values1d"] = window.tolist()
                 info["total_shape"] = total_shape
             elif ndim == 2:
                 row_base = row_offset
@@ -581,7 +822,13 @@ def preview_data(name: str,
                 col_end = col_base + cols_limit if cols_limit > 0 else None
                 info["row_offset"] = row_base
                 info["col_offset"] = col_base
-                info["rows"] = obj[row_base:row_end, col_base:col_end].tolist()
+                window = obj[row_base:row_end, col_base:col_end]
+                entry = _packed_numeric(window, np_mod) if packed else None
+                if entry is not None:
+                    entry["shape"] = [int(window.shape[0]), int(window.shape[1])]
+                    info["packed_rows"] = entry
+                else:
+                    info["rows"] = window.tolist()
                 info["total_shape"] = total_shape
             else:
                 info["repr"] = _safe_repr(obj, 300)
@@ -6,12 +6,204 @@ from __future__ import annotations
 import argparse
 import ast
 import base64
+import hashlib
+import hmac
 import json
+import math
+import os
+import selectors
 import socket
+import struct
 import sys
 import time
+import zlib
+from collections import deque
+from functools import partial
 from pathlib import Path
-from typing import IO, Callable, Optional, Tuple
+from typing import IO, Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+try:  # Optional fast JSON codec; the stdlib module stays the fallback.
+    import orjson as _orjson
+except Exception:  # pragma: no cover - depends on the environment
+    _orjson = None
+
+# Loopback buffers sized so a full preview payload fits in a single recv.
+_PREVIEW_SOCKET_BUFFER = 1 << 20
+_PREVIEW_RECV_SIZE = 1 << 16
+# Larger response frames are treated as a corrupt stream, not allocated.
+_PREVIEW_MAX_RESPONSE = 1 << 28
+# Debug preview frames: 4-byte big-endian length followed by a JSON body.
+_PREVIEW_FRAME_HEADER = struct.Struct(">I")
+_IOPUB_TIMEOUT = 5.0
+_STDIN_READ_SIZE = 1 << 16
+# Reads straight into a preallocated buffer; missing on Windows.
+_readv = getattr(os, "readv", None)
+
+# vars/preview run as the same silent cell every time; the request itself
+# travels as JSON text in a user expression answered by ``__mi_request``.
+_REQUEST_CELL = "_ipy_mark_helper_execution()"
+_REQUEST_EXPR = "__mi_request(%r)"
+# JSON request bodies, filled with %-formatting once per request.
+_VARS_REQUEST = '{"op":"vars","token":%s,"max_repr":%d,"hide_names":%s,"hide_types":%s}'
+_PREVIEW_REQUEST = (
+    '{"op":"preview","name":%s,"max_rows":%d,"max_cols":%d,"row_offset":%d,"col_offset":%d}'
+)
+_DEBUG_PREVIEW_CODE = (
+    "__mi_debug_preview('%s', max_rows=%d, max_cols=%d, row_offset=%d, col_offset=%d)"
+)
+
+# Debug preview endpoint: a TCP port or a ``unix:<name>`` abstract socket.
+PreviewAddress = Union[int, str]
+
+
+def _parse_preview_address(value) -> Optional[PreviewAddress]:
+    """Normalise a debug preview endpoint reported by the kernel."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.startswith("unix:"):
+        return text if len(text) > len("unix:") else None
+    try:
+        port = int(text)
+    except ValueError:
+        return None
+    return port if port > 0 else None
+
+
+# Fallback encoder: one cached instance, compact separators, no ASCII escaping.
+_JSON_ENCODE = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON, preferring orjson and falling back on what it rejects."""
+    if _orjson is not None:
+        try:
+            return _orjson.loads(data)
+        except ValueError:
+            # orjson refuses NaN/Infinity literals that stdlib json emits.
+            pass
+    return json.loads(data)
+
+
+def _has_non_finite(obj: Any) -> bool:
+    """Return True if ``obj`` holds a NaN or infinite float anywhere."""
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, float):
+            if not math.isfinite(item):
+                return True
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return False
+
+
+def _orjson_encode(obj: Any, option: int) -> Optional[bytes]:
+    """Encode with orjson, or return None where the stdlib must be used.
+
+    orjson writes NaN/Infinity as null while the stdlib emits the literals
+    the frontend decodes; a "null" in the output triggers the scan for them.
+    """
+    try:
+        data = _orjson.dumps(obj, option=option)
+    except TypeError:
+        # Integers beyond 64 bits and other exotic values.
+        return None
+    if b"null" in data and _has_non_finite(obj):
+        return None
+    return data
+
+
+def _json_dumps(obj: Any) -> str:
+    """Encode JSON without ASCII escaping, preferring orjson."""
+    if _orjson is not None:
+        data = _orjson_encode(obj, _orjson.OPT_NON_STR_KEYS)
+        if data is not None:
+            return data.decode("utf-8")
+    return _JSON_ENCODE(obj)
+
+
+def _json_line(obj: Any) -> bytes:
+    """Encode one NDJSON response line, trailing newline included, as UTF-8."""
+    if _orjson is not None:
+        data = _orjson_encode(obj, _orjson.OPT_NON_STR_KEYS | _orjson.OPT_APPEND_NEWLINE)
+        if data is not None:
+            return data
+    return (_JSON_ENCODE(obj) + "\n").encode("utf-8")
+
+
+def _unquote_str_repr(text: str) -> str:
+    """Undo ``repr()`` of a str without going through the ast compiler."""
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        body = text[1:-1]
+        if "\\" not in body:
+            return body
+        try:
+            # backslashreplace keeps non-Latin-1 characters intact through
+            # the unicode_escape round trip.
+            return body.encode("latin-1", "backslashreplace").decode("unicode_escape")
+        except UnicodeError:
+            pass
+    return ast.literal_eval(text)
+
+
+# struct codes for the numpy dtype strings used by packed preview data.
+_PACKED_CODES = {
+    "f": {2: "e", 4: "f", 8: "d"},
+    "i": {1: "b", 2: "h", 4: "i", 8: "q"},
+    "u": {1: "B", 2: "H", 4: "I", 8: "Q"},
+    "b": {1: "?"},
+}
+
+
+def _unpack_numeric(entry: dict) -> list:
+    """Decode a ``{"format", "data"}`` entry into a flat list of numbers."""
+    fmt = entry["format"]
+    code = _PACKED_CODES[fmt[1]][int(fmt[2:])]
+    raw = base64.b64decode(entry["data"])
+    order = ">" if fmt[0] == ">" else "<"
+    return list(struct.unpack(f"{order}{len(raw) // struct.calcsize(code)}{code}", raw))
+
+
+def _expand_packed_preview(data: Any) -> Any:
+    """Turn a preview's packed fields back into the plain lists the editor reads.
+
+    DataFrame ``packed_columns`` become ``rows`` with NaN as None, matching
+    unpacked DataFrame cells; ndarray ``packed_values1d``/``packed_rows``
+    keep NaN, as ``tolist()`` would.
+    """
+    if not isinstance(data, dict):
+        return data
+    if "packed_values1d" in data:
+        data["values1d"] = _unpack_numeric(data.pop("packed_values1d"))
+    if "packed_rows" in data:
+        entry = data.pop("packed_rows")
+        values = _unpack_numeric(entry)
+        width = int(entry["shape"][1])
+        count = int(entry["shape"][0])
+        data["rows"] = [values[index * width:(index + 1) * width] for index in range(count)]
+    if "packed_columns" not in data:
+        return data
+    columns = []
+    for entry in data.pop("packed_columns") or []:
+        if "values" in entry:
+            columns.append(entry["values"])
+            continue
+        values = _unpack_numeric(entry)
+        if entry["format"][1] == "f":
+            values = [None if value != value else value for value in values]
+        columns.append(values)
+    if columns:
+        data["rows"] = [list(row) for row in zip(*columns)]
+    else:
+        data["rows"] = [[] for _ in range(int((data.get("shape") or [0])[0]))]
+    return data
 
 
 class Logger:
@@ -20,6 +212,11 @@ class Logger:
     def __init__(self, enabled: bool) -> None:
         self._enabled = enabled
 
+    @property
+    def enabled(self) -> bool:
+        """Guard for call sites that would otherwise format messages per IOPub frame."""
+        return self._enabled
+
     def log(self, message: str) -> None:
         if not self._enabled:
             return
@@ -35,29 +232,226 @@ class BootstrapPayload:
 
     def __init__(self, module_path: Path, helpers_path: Path) -> None:
         module_src = module_path.read_text(encoding="utf-8")
-        self._module_b64 = base64.b64encode(module_src.encode("utf-8")).decode("ascii")
-        self._template = helpers_path.read_text(encoding="utf-8")
+        module_b64 = base64.b64encode(module_src.encode("utf-8")).decode("ascii")
+        template = helpers_path.read_text(encoding="utf-8")
+        body = template.replace("__MODULE_B64__", module_b64).encode("utf-8")
+        self._digest = hashlib.sha1(body).hexdigest()
+        # Compressed once here: the literal is a third of the size, so every
+        # connect ships and IPython transforms far less, and only a kernel
+        # without the helpers pays for inflating it.
+        self._packed_body = base64.b64encode(zlib.compress(body, 9)).decode("ascii")
+        self._built: Dict[bool, str] = {}
 
     def build(self, enable_debug: bool) -> str:
-        prelude = self._template.replace("__MODULE_B64__", self._module_b64)
+        """Return the prelude, guarded so a warm kernel skips the helper body.
+
+        The helpers travel as one compressed literal and are only inflated,
+        compiled and executed when the kernel does not already hold this
+        exact version, so reconnecting to a live kernel costs a dict lookup
+        instead of re-running the whole prelude (and rebuilding the preview
+        server).
+        """
+        cached = self._built.get(bool(enable_debug))
+        if cached is not None:
+            return cached
+        digest = self._digest
         flag = "True" if enable_debug else "False"
         prelude = (
-            f"{prelude}\n"
+            f"if globals().get('__IPYBRIDGE_PRELUDE__') != {digest!r}:\n"
+            "    exec(compile(__import__('zlib').decompress(__import__('base64').b64decode(\n"
+            f"        {self._packed_body!r})).decode('utf-8'), '<ipybridge-prelude>', 'exec'), globals())\n"
+            f"    __IPYBRIDGE_PRELUDE__ = {digest!r}\n"
             f"_myipy_set_debug_logging({flag})\n"
             "__IPYBRIDGE_DEBUG_PORT__ = _DEBUG_PREVIEW.ensure_running()\n"
             "print('__IPYBRIDGE_DEBUG_PORT__:' + str(__IPYBRIDGE_DEBUG_PORT__))\n"
         )
+        self._built[bool(enable_debug)] = prelude
         return prelude
 
 
+class IopubReader:
+    """Drain IOPub straight off the ZMQ socket, waking via epoll/kqueue.
+
+    Every wakeup pulls all queued frames with ``NOBLOCK`` so bursts cost one
+    wait instead of one poll per message. Messages are routed into one queue
+    per expected parent ``msg_id`` so several in-flight requests can be
+    collected one after another; everything else is dropped. Clients without
+    a raw socket (test doubles, exotic transports) fall back to
+    ``get_iopub_msg``.
+    """
+
+    def __init__(self, client) -> None:
+        self._client = client
+        self._queues: Dict[str, deque] = {}
+        self._zmq = None
+        self._socket = None
+        self._session = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._fd: Optional[int] = None
+        try:
+            import zmq
+
+            sock = client.iopub_channel.socket
+            session = client.session
+            fd = sock.getsockopt(zmq.FD)
+            selector = selectors.DefaultSelector()
+            selector.register(fd, selectors.EVENT_READ)
+        except Exception:
+            return
+        self._zmq = zmq
+        self._socket = sock
+        self._session = session
+        self._selector = selector
+        self._fd = fd
+
+    def fileno(self) -> Optional[int]:
+        """Return the pollable IOPub descriptor, or None on the fallback path."""
+        return self._fd
+
+    def discard(self) -> None:
+        """Drop whatever is queued on the socket (output of unrelated cells)."""
+        if self._socket is None:
+            return
+        try:
+            self._drain()
+        except Exception:
+            pass
+
+    def expect(self, parent_id: str) -> None:
+        """Keep messages for ``parent_id`` until :meth:`release` is called."""
+        self._queues.setdefault(parent_id, deque())
+
+    def release(self, parent_id: str) -> None:
+        self._queues.pop(parent_id, None)
+
+    def get(self, timeout: float, parent_id: str) -> dict:
+        """Return the next IOPub message sent in reply to ``parent_id``."""
+        queue = self._queues.setdefault(parent_id, deque())
+        if not queue:
+            self._fill(timeout, queue)
+        if not queue:
+            raise TimeoutError("no iopub message")
+        return queue.popleft()
+
+    def _fill(self, timeout: float, queue: deque) -> None:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._socket is None:
+                self._route(self._client.get_iopub_msg(timeout=max(0.0, deadline - time.monotonic())))
+            else:
+                self._drain()
+            if queue:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._selector is not None:
+                # The ZMQ FD is edge-triggered; _drain() re-arms it via ZMQ_EVENTS.
+                self._selector.select(remaining)
+
+    def _route(self, msg: dict) -> None:
+        queue = self._queues.get(msg.get("parent_header", {}).get("msg_id"))
+        if queue is not None:
+            queue.append(msg)
+
+    def _drain(self) -> None:
+        zmq = self._zmq
+        sock = self._socket
+        session = self._session
+        queues = self._queues
+        while sock.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            try:
+                frames = sock.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            _, msg_list = session.feed_identities(frames)
+            if len(msg_list) >= 5:
+                # msg_list is [signature, header, parent_header, metadata, content, ...];
+                # skip verifying and unpacking the rest of unrelated messages.
+                try:
+                    parent = session.unpack(msg_list[2])
+                except Exception:
+                    parent = None
+                if isinstance(parent, dict):
+                    queue = queues.get(parent.get("msg_id"))
+                    if queue is not None:
+                        queue.append(self._decode(msg_list, parent))
+                    continue
+            self._route(session.deserialize(msg_list))
+
+    def _decode(self, msg_list: list, parent: dict) -> dict:
+        """Decode only what the collectors read, still checking the signature.
+
+        ``Session.deserialize`` also unpacks metadata and parses every header
+        date with a regex, which is most of its cost per message.
+        """
+        session = self._session
+        if session.auth is not None:
+            if not msg_list[0] or not hmac.compare_digest(msg_list[0], session.sign(msg_list[1:5])):
+                raise ValueError("invalid IOPub message signature")
+        header = session.unpack(msg_list[1])
+        return {
+            "header": header,
+            "msg_id": header.get("msg_id"),
+            "msg_type": header.get("msg_type"),
+            "parent_header": parent,
+            "metadata": {},
+            "content": session.unpack(msg_list[4]),
+            "buffers": [],
+        }
+
+
+class _ExecOutput:
+    """What one execute request produced on IOPub so far."""
+
+    __slots__ = ("stdout", "success", "error_text", "idle")
+
+    def __init__(self) -> None:
+        self.stdout: list = []
+        self.success = True
+        self.error_text: Optional[str] = None
+        self.idle = False
+
+
+def _on_stream(state: _ExecOutput, content: dict) -> None:
+    if content.get("name") == "stdout":
+        state.stdout.append(content.get("text", ""))
+
+
+def _on_error(state: _ExecOutput, content: dict) -> None:
+    state.success = False
+    state.error_text = "\n".join(content.get("traceback", []))
+
+
+def _on_status(state: _ExecOutput, content: dict) -> None:
+    if content.get("execution_state") == "idle":
+        state.idle = True
+
+
+def _on_debug_reply(state: _ExecOutput, content: dict) -> None:
+    state.idle = True
+
+
+_IOPUB_HANDLERS: Dict[str, Callable[[_ExecOutput, dict], None]] = {
+    "stream": _on_stream,
+    "error": _on_error,
+    "status": _on_status,
+    "debug_reply": _on_debug_reply,
+}
+
+
 class KernelChannel:
     """Wrapper around BlockingKernelClient with high-level helpers."""
 
     def __init__(self, client_factory: Callable[[], object], logger: Logger) -> None:
         self._client_factory = client_factory
         self._logger = logger
+        self._verbose = bool(getattr(logger, "enabled", True))
         self._client = None
-        self._debug_port: Optional[int] = None
+        self._iopub: Optional[IopubReader] = None
+        self._debug_address: Optional[PreviewAddress] = None
+        self._conn_file: Optional[str] = None
+        self._conn_info: Optional[dict] = None
 
     @property
     def client(self):  # type: ignore[override]
@@ -66,17 +460,50 @@ class KernelChannel:
         return self._client
 
     @property
-    def debug_port(self) -> Optional[int]:
-        return self._debug_port
+    def debug_address(self) -> Optional[PreviewAddress]:
+        return self._debug_address
 
     def connect(self, conn_file: str, prelude: str) -> None:
         client = self._client_factory()
-        client.load_connection_file(conn_file)
+        self._load_connection(client, conn_file)
         client.start_channels()
         self._logger.log("channels started")
+        self._tune_session(client)
         self._client = client
+        self._iopub = IopubReader(client)
         self._send_prelude(prelude)
 
+    @staticmethod
+    def _tune_session(client) -> None:
+        """Trim per-message bookkeeping without touching the wire format.
+
+        Signing and the packer must match what the kernel expects, so only
+        client-local work changes: no fork check on every send, and the
+        faster JSON decoder for received frames.
+        """
+        session = getattr(client, "session", None)
+        if session is None:
+            return
+        try:
+            session.check_pid = False
+            # Only JSON sessions can share the decoder; a pickle or msgpack
+            # packer configured on the kernel must keep its own unpack.
+            if _orjson is not None and getattr(session, "unpacker", None) in ("json", "orjson"):
+                session.unpack = _json_loads
+        except Exception:
+            pass
+
+    def _load_connection(self, client, conn_file: str) -> None:
+        """Apply connection info, parsing the file only once per path."""
+        loader = getattr(client, "load_connection_info", None)
+        if not callable(loader):
+            client.load_connection_file(conn_file)
+            return
+        if self._conn_info is None or self._conn_file != conn_file:
+            self._conn_info = _json_loads(Path(conn_file).read_bytes())
+            self._conn_file = conn_file
+        loader(self._conn_info)
+
     def _send_prelude(self, prelude: str) -> None:
         msg_id = self.client.execute(
             prelude,
@@ -84,38 +511,35 @@ class KernelChannel:
             allow_stdin=False,
             stop_on_error=False,
         )
-        stdout_chunks = ""
+        # One wait: the kernel sends the shell reply before it reports idle,
+        # so once IOPub goes idle the reply is already queued.
+        self._iopub.expect(msg_id)
         try:
-            self.client.get_shell_msg(timeout=5)
+            stdout_text, _, _, _ = self._gather(msg_id)
+        finally:
+            self._iopub.release(msg_id)
+        try:
+            self._shell_reply(msg_id)
         except Exception:
             pass
-        while True:
-            try:
-                io_msg = self.client.get_iopub_msg(timeout=0.2)
-            except Exception:
-                break
-            if (
-                io_msg.get("msg_type") == "status"
-                and io_msg.get("content", {}).get("execution_state") == "idle"
-            ):
-                break
-            if (
-                io_msg.get("msg_type") == "stream"
-                and io_msg.get("content", {}).get("name") == "stdout"
-            ):
-                stdout_chunks += io_msg.get("content", {}).get("text", "")
-        if stdout_chunks:
-            for line in stdout_chunks.splitlines():
+        if stdout_text:
+            for line in stdout_text.splitlines():
                 if line.startswith("__IPYBRIDGE_DEBUG_PORT__:"):
-                    try:
-                        self._debug_port = int(line.split(":", 1)[1])
-                        self._logger.log(
-                            f"debug preview port captured {self._debug_port}"
-                        )
-                    except Exception:
-                        self._logger.log("failed to parse debug preview port from prelude")
+                    address = _parse_preview_address(line.split(":", 1)[1])
+                    if address is None:
+                        self._logger.log("failed to parse debug preview address from prelude")
+                        continue
+                    self._debug_address = address
+                    self._logger.log(f"debug preview address captured {address}")
         self._logger.log("prelude ready")
 
+    def watchers(self) -> list:
+        """Return ``(fd, callback)`` pairs to service while waiting for requests."""
+        fd = self._iopub.fileno() if self._iopub is not None else None
+        if fd is None:
+            return []
+        return [(fd, self._iopub.discard)]
+
     @staticmethod
     def _shorten(src: str, limit: int = 80) -> str:
         src = src.replace("\n", " ")
@@ -129,62 +553,103 @@ class KernelChannel:
         *,
         user_expression: Optional[str] = None,
     ) -> Tuple[bool, Optional[dict], Optional[str]]:
+        return self.collect(self.submit(code, user_expression=user_expression))
+
+    def submit(self, code: str, *, user_expression: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """Send ``code`` without waiting; pass the result to :meth:`collect`.
+
+        The kernel runs requests in order, so several submissions can be in
+        flight and collected one after another. With ``user_expression`` the
+        cell runs silently and the expression's value is the result.
+        """
         exec_id = self.client.execute(
             code,
             store_history=False,
             allow_stdin=False,
             stop_on_error=True,
             user_expressions={"_": user_expression} if user_expression else None,
-            silent=bool(user_expression and not code.strip()),
+            silent=bool(user_expression),
         )
-        stdout_chunks = ""
-        success = True
-        error_text = None
-        idle = False
-        start = time.time()
+        self._iopub.expect(exec_id)
+        if self._verbose:
+            self._logger.log(
+                f"exec len={len(code)} expr? {bool(user_expression)} payload={self._shorten(code)}"
+            )
+        return exec_id, user_expression
 
-        self._logger.log(
-            f"exec len={len(code)} expr? {bool(user_expression)} payload={self._shorten(code)}"
-        )
+    def collect(self, pending: Tuple[str, Optional[str]]) -> Tuple[bool, Optional[dict], Optional[str]]:
+        exec_id, user_expression = pending
+        try:
+            return self._collect(exec_id, user_expression)
+        finally:
+            self._iopub.release(exec_id)
+
+    def _shell_reply(self, msg_id: str) -> dict:
+        """Return the shell reply for ``msg_id``, dropping stale replies.
+
+        A request that failed on IOPub never reads its reply, so the next one
+        may find it first.
+        """
+        deadline = time.monotonic() + _IOPUB_TIMEOUT
+        while True:
+            reply = self.client.get_shell_msg(timeout=max(0.0, deadline - time.monotonic()))
+            parent_id = (reply.get("parent_header") or {}).get("msg_id")
+            if parent_id is None or parent_id == msg_id:
+                return reply
+            self._logger.log(f"dropping stale shell reply parent={parent_id}")
+
+    def _gather(self, exec_id: str) -> Tuple[str, bool, Optional[str], bool]:
+        """Read IOPub for ``exec_id`` until idle.
+
+        Returns ``(stdout_text, success, error_text, idle)``.
+        """
+        state = _ExecOutput()
+        handlers = _IOPUB_HANDLERS
+        get = self._iopub.get
+        deadline = time.monotonic() + _IOPUB_TIMEOUT
 
         try:
-            while not idle and (time.time() - start) < 5.0:
-                msg = self.client.get_iopub_msg(timeout=0.5)
+            while not state.idle:
+                # Wait on the whole budget so a quiet gap in a slow cell does
+                # not end collection before the kernel reports idle.
+                msg = get(max(0.0, deadline - time.monotonic()), exec_id)
                 if msg.get("parent_header", {}).get("msg_id") != exec_id:
                     continue
                 msg_type = msg.get("msg_type")
-                self._logger.log(
-                    f"iopub msg type={msg_type} keys={list(msg.keys())}"
-                )
-                if msg_type == "stream" and msg.get("content", {}).get("name") == "stdout":
-                    stdout_chunks += msg.get("content", {}).get("text", "")
-                elif msg_type == "error":
-                    success = False
-                    error_text = "\n".join(msg.get("content", {}).get("traceback", []))
-                elif msg_type == "status" and msg.get("content", {}).get("execution_state") == "idle":
-                    idle = True
-                elif msg_type == "debug_reply":
+                content = msg.get("content") or {}
+                if self._verbose:
                     self._logger.log(
-                        f"debug reply content keys={list(msg.get('content', {}).keys())}"
+                        f"iopub msg type={msg_type} keys={list(msg.keys())}"
                     )
-                    idle = True
+                    if msg_type == "debug_reply":
+                        self._logger.log(f"debug reply content keys={list(content.keys())}")
+                handler = handlers.get(msg_type)
+                if handler is not None:
+                    handler(state, content)
         except Exception as exc:
             self._logger.log(f"iopub loop error: {exc}")
 
-        self._logger.log(f"stdout bytes={len(stdout_chunks)} idle={idle}")
+        # Join once; repeated str += is quadratic on large previews.
+        stdout_text = "".join(state.stdout)
+        if self._verbose:
+            self._logger.log(f"stdout bytes={len(stdout_text)} idle={state.idle}")
+        return stdout_text, state.success, state.error_text, state.idle
+
+    def _collect(self, exec_id: str, user_expression: Optional[str]) -> Tuple[bool, Optional[dict], Optional[str]]:
+        stdout_text, success, error_text, _ = self._gather(exec_id)
         if not success:
             tail = error_text.splitlines()[-1] if error_text else "?"
             self._logger.log(f"kernel error: {tail}")
             return False, None, error_text
 
         try:
-            reply = self.client.get_shell_msg(timeout=5)
+            reply = self._shell_reply(exec_id)
         except Exception as exc:
             context = "shell reply timeout (expr)" if user_expression else "shell reply timeout"
             self._logger.log(f"{context}: {exc}")
-            if stdout_chunks:
+            if stdout_text:
                 try:
-                    data = json.loads(stdout_chunks.strip())
+                    data = _json_loads(stdout_text.strip())
                     return True, data, None
                 except Exception as parse_exc:
                     self._logger.log(f"stdout parse error after timeout: {parse_exc}")
@@ -192,9 +657,10 @@ class KernelChannel:
 
         content = reply.get("content") or {}
         status = content.get("status") or "ok"
-        self._logger.log(
-            f"shell reply status={status} keys={list(content.keys())}"
-        )
+        if self._verbose:
+            self._logger.log(
+                f"shell reply status={status} keys={list(content.keys())}"
+            )
         if status != "ok":
             err = content.get("ename") and content.get("evalue")
             if err:
@@ -205,9 +671,10 @@ class KernelChannel:
 
         if user_expression:
             expr_payload = (content.get("user_expressions") or {}).get("_") or {}
-            self._logger.log(
-                f"user expr payload status={expr_payload.get('status')} keys={list(expr_payload.keys())}"
-            )
+            if self._verbose:
+                self._logger.log(
+                    f"user expr payload status={expr_payload.get('status')} keys={list(expr_payload.keys())}"
+                )
             if expr_payload.get("status") != "ok":
                 err = expr_payload.get("ename") or expr_payload.get("status") or "error"
                 return False, None, err
@@ -216,20 +683,24 @@ class KernelChannel:
                 self._logger.log("user expr data field empty")
                 return False, None, "empty payload"
             json_text = data_field.get("application/json")
+            if isinstance(json_text, (dict, list)):
+                # Already decoded along with the reply message.
+                return True, json_text, None
             if json_text is None and "text/plain" in data_field:
                 text_value = data_field["text/plain"]
-                self._logger.log(
-                    f"user expr text/plain={self._shorten(str(text_value))}"
-                )
+                if self._verbose:
+                    self._logger.log(
+                        f"user expr text/plain={self._shorten(str(text_value))}"
+                    )
                 try:
-                    json_text = ast.literal_eval(text_value) if isinstance(text_value, str) else text_value
+                    json_text = _unquote_str_repr(text_value) if isinstance(text_value, str) else text_value
                 except Exception:
-                    self._logger.log("user expr literal_eval failed; using raw text")
+                    self._logger.log("user expr unquote failed; using raw text")
                     json_text = text_value
             if json_text is None:
                 return False, None, "empty payload"
             try:
-                data = json.loads(json_text)
+                data = _json_loads(json_text)
                 return True, data, None
             except Exception as exc:
                 self._logger.log(
@@ -237,16 +708,17 @@ class KernelChannel:
                 )
                 return False, None, f"parse error: {exc}"
 
-        payload = stdout_chunks.strip()
+        payload = stdout_text.strip()
         if not payload:
             self._logger.log("empty payload from kernel")
             return False, None, "empty payload"
-        self._logger.log(f"parsing payload from stdout len={len(payload)}")
+        if self._verbose:
+            self._logger.log(f"parsing payload from stdout len={len(payload)}")
         try:
-            data = json.loads(payload)
+            data = _json_loads(payload)
             return True, data, None
         except Exception as exc:
-            snippet = stdout_chunks[:120]
+            snippet = stdout_text[:120]
             self._logger.log(f"parse error: {exc}; payload={snippet!r}")
             return False, None, f"parse error: {exc}"
 
@@ -261,12 +733,19 @@ class KernelChannel:
             stop_on_error=True,
             silent=True,
         )
+        self._iopub.expect(msg_id)
+        try:
+            return self._collect_silent(msg_id)
+        finally:
+            self._iopub.release(msg_id)
+
+    def _collect_silent(self, msg_id: str) -> Tuple[bool, Optional[str]]:
         error_text: Optional[str] = None
         idle = False
-        start = time.time()
+        deadline = time.monotonic() + _IOPUB_TIMEOUT
         try:
-            while not idle and (time.time() - start) < 5.0:
-                msg = self.client.get_iopub_msg(timeout=0.5)
+            while not idle:
+                msg = self._iopub.get(max(0.0, deadline - time.monotonic()), msg_id)
                 if msg.get("parent_header", {}).get("msg_id") != msg_id:
                     continue
                 msg_type = msg.get("msg_type")
@@ -289,7 +768,7 @@ class KernelChannel:
             return False, str(exc)
 
         try:
-            reply = self.client.get_shell_msg(timeout=5)
+            reply = self._shell_reply(msg_id)
         except Exception as exc:
             self._logger.log(f"silent exec shell timeout: {exc}")
             return False, f"shell timeout: {exc}"
@@ -315,69 +794,221 @@ class DebugPreviewClient:
     def __init__(self, channel: KernelChannel, logger: Logger) -> None:
         self._channel = channel
         self._logger = logger
-        self._port: Optional[int] = None
-
-    def ensure_port(self) -> Optional[int]:
-        if self._port:
-            return self._port
-        channel_port = getattr(self._channel, "debug_port", None)
-        if isinstance(channel_port, int) and channel_port > 0:
-            self._port = channel_port
-            return self._port
+        self._address: Optional[PreviewAddress] = None
+        self._sock: Optional[socket.socket] = None
+        # Reused for every response; grows only for unusually large previews.
+        self._recv_buf = bytearray(_PREVIEW_RECV_SIZE)
+
+    def ensure_address(self) -> Optional[PreviewAddress]:
+        if self._address:
+            return self._address
+        channel_address = _parse_preview_address(getattr(self._channel, "debug_address", None))
+        if channel_address is not None:
+            self._address = channel_address
+            return self._address
         ok, data, err = self._channel.run_and_collect("__mi_debug_server_info()")
         if not ok or not isinstance(data, dict):
             self._logger.log(f"debug server info failed: {err}")
             return None
-        port = data.get("port")
-        if isinstance(port, int) and port > 0:
-            self._port = port
-            self._logger.log(f"debug preview port set to {port}")
-            return port
-        self._logger.log("debug preview port unavailable")
+        address = _parse_preview_address(data.get("address") or data.get("port"))
+        if address is not None:
+            self._address = address
+            self._logger.log(f"debug preview address set to {address}")
+            return address
+        self._logger.log("debug preview address unavailable")
         return None
 
+    @staticmethod
+    def _tune_socket(sock: socket.socket) -> None:
+        """Enlarge loopback buffers, disable Nagle and keep the idle link alive."""
+        for level, option, value in (
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, _PREVIEW_SOCKET_BUFFER),
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, _PREVIEW_SOCKET_BUFFER),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        ):
+            try:
+                sock.setsockopt(level, option, value)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _endpoint(address: PreviewAddress):
+        if isinstance(address, str):
+            # Abstract namespace names carry a leading NUL on the wire.
+            return socket.AF_UNIX, "\0" + address[len("unix:"):]
+        return socket.AF_INET, ("127.0.0.1", address)
+
+    def _connection(self, address: PreviewAddress) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+        family, target = self._endpoint(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            self._tune_socket(sock)
+            sock.settimeout(2.0)
+            sock.connect(target)
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, view: memoryview) -> None:
+        filled = 0
+        size = len(view)
+        while filled < size:
+            count = sock.recv_into(view[filled:])
+            if not count:
+                raise ConnectionError("preview server closed the connection")
+            filled += count
+
+    def _recv_frame(self, sock: socket.socket) -> bytes:
+        header_size = _PREVIEW_FRAME_HEADER.size
+        self._recv_exact(sock, memoryview(self._recv_buf)[:header_size])
+        (length,) = _PREVIEW_FRAME_HEADER.unpack_from(self._recv_buf)
+        if length > _PREVIEW_MAX_RESPONSE:
+            # Raising drops the connection; its remaining bytes are unusable.
+            raise ConnectionError(f"preview frame too large: {length} bytes")
+        if length > len(self._recv_buf):
+            self._recv_buf = bytearray(length)
+        view = memoryview(self._recv_buf)[:length]
+        self._recv_exact(sock, view)
+        return bytes(view)
+
     def request(self, name: str, rows: int, cols: int, row_offset: int, col_offset: int) -> Tuple[bool, Optional[dict], Optional[str]]:
-        port = self.ensure_port()
-        if not port:
+        address = self.ensure_address()
+        if not address:
             return False, None, "debug preview server unavailable"
-        payload = json.dumps(
+        body = _json_dumps(
             {
                 "name": name,
                 "max_rows": rows,
                 "max_cols": cols,
                 "row_offset": row_offset,
                 "col_offset": col_offset,
-            },
-            ensure_ascii=False,
-        ).encode("utf-8") + b"\n"
-        try:
-            with socket.create_connection(("127.0.0.1", port), timeout=2.0) as sock:
-                sock.sendall(payload)
-                sock.shutdown(socket.SHUT_WR)
-                chunks = b""
-                sock.settimeout(2.0)
-                while True:
-                    chunk = sock.recv(4096)
-                    if not chunk:
-                        break
-                    chunks += chunk
-                    if b"\n" in chunk:
-                        break
-        except Exception as exc:
-            self._logger.log(f"debug preview socket error: {exc}")
-            return False, None, f"socket error: {exc}"
+                "packed": True,
+            }
+        ).encode("utf-8")
+        frame = _PREVIEW_FRAME_HEADER.pack(len(body)) + body
+        chunks = None
+        # A stale connection (kernel restarted the server) gets one reconnect.
+        for attempt in range(2):
+            try:
+                sock = self._connection(address)
+                sock.sendall(frame)
+                chunks = self._recv_frame(sock)
+                break
+            except Exception as exc:
+                self._close()
+                if attempt:
+                    self._logger.log(f"debug preview socket error: {exc}")
+                    return False, None, f"socket error: {exc}"
         if not chunks:
             return False, None, "empty response"
         try:
-            response = json.loads(chunks.decode("utf-8").strip())
+            response = _json_loads(chunks)
         except Exception as exc:
             return False, None, f"decode error: {exc}"
         ok = bool(response.get("ok"))
-        data = response.get("data")
+        try:
+            data = _expand_packed_preview(response.get("data"))
+        except Exception as exc:
+            return False, None, f"decode error: {exc}"
         err = response.get("error")
         return ok, data, err
 
 
+class RequestReader:
+    """Split NDJSON requests off a pipe, a batch of complete lines at a time.
+
+    ``os.read`` returns everything already written to the pipe, so requests
+    the frontend sends back to back arrive together and can be pipelined.
+    Streams without a file descriptor are read one line at a time.
+
+    ``watchers`` are ``(fd, callback)`` pairs polled together with the input,
+    so kernel traffic is consumed while the frontend is quiet instead of
+    piling up until the next request.
+    """
+
+    def __init__(self, stream: IO, watchers: Optional[list] = None) -> None:
+        self._stream = stream
+        self._buf = bytearray()
+        self._chunk = bytearray(_STDIN_READ_SIZE)
+        self._selector: Optional[selectors.BaseSelector] = None
+        try:
+            self._fd: Optional[int] = stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            self._fd = None
+        if self._fd is not None and watchers:
+            selector = selectors.DefaultSelector()
+            try:
+                # Fails for regular files and for pipes on Windows; plain
+                # blocking reads are used then.
+                selector.register(self._fd, selectors.EVENT_READ)
+                for fd, callback in watchers:
+                    selector.register(fd, selectors.EVENT_READ, callback)
+            except (OSError, ValueError):
+                selector.close()
+            else:
+                self._selector = selector
+
+    def read_batch(self) -> list:
+        """Return the next complete lines; an empty list means end of input."""
+        if self._fd is None:
+            line = self._stream.readline()
+            return [line] if line else []
+        buf = self._buf
+        while b"\n" not in buf:
+            self._wait_readable()
+            count = self._read_chunk()
+            if not count:
+                tail = bytes(buf)
+                buf.clear()
+                return [tail] if tail else []
+            buf += memoryview(self._chunk)[:count]
+        cut = buf.rindex(b"\n") + 1
+        with memoryview(buf) as view:
+            lines = view[:cut].tobytes().splitlines()
+        del buf[:cut]
+        return lines
+
+    def _read_chunk(self) -> int:
+        """Read into the reusable chunk buffer; return the byte count."""
+        if _readv is not None:
+            return _readv(self._fd, [self._chunk])
+        data = os.read(self._fd, _STDIN_READ_SIZE)
+        self._chunk[: len(data)] = data
+        return len(data)
+
+    def _wait_readable(self) -> None:
+        selector = self._selector
+        if selector is None:
+            return
+        watched = [key.data for key in selector.get_map().values() if key.data is not None]
+        # Edge-triggered sources may hold data that arrived before this wait.
+        for callback in watched:
+            callback()
+        while True:
+            ready = False
+            for key, _ in selector.select():
+                if key.data is None:
+                    ready = True
+                else:
+                    key.data()
+            if ready:
+                return
+
+
 class RequestProcessor:
     """Route frontend JSON requests to kernel helpers."""
 
@@ -385,48 +1016,140 @@ class RequestProcessor:
         self._channel = channel
         self._preview = preview_client
         self._logger = logger
+        self._verbose = bool(getattr(logger, "enabled", True))
+        # Last (hide_names, hide_types) and their JSON; the filters rarely change between polls.
+        self._filter_exprs: Optional[Tuple[list, list, str, str]] = None
+        # (request key, kernel namespace token, variables) of the last full listing.
+        self._vars_cache: Optional[Tuple[tuple, str, dict]] = None
+        self._handlers: Dict[str, Callable[[Any, dict], dict]] = {
+            "ping": self._handle_ping,
+            "vars": self._handle_vars,
+            "preview": self._handle_preview,
+            "exec": self._handle_exec,
+        }
 
-    def process_stream(self, stream: IO[str], output: IO[str]) -> None:
-        for raw in stream:
-            line = raw.strip()
-            if not line:
-                continue
-            try:
-                request = json.loads(line)
-            except Exception:
-                continue
-            response = self._handle_request(request)
-            if response is None:
-                continue
-            output.write(json.dumps(response, ensure_ascii=False) + "\n")
+    def process_stream(self, stream: IO, output: IO[str]) -> None:
+        """Serve NDJSON requests; ``stream`` may yield bytes or str lines."""
+        watchers = getattr(self._channel, "watchers", None)
+        reader = RequestReader(stream, watchers() if callable(watchers) else None)
+        # Write encoded bytes straight to the binary layer when there is one.
+        sink = getattr(output, "buffer", None)
+        if sink is not None:
             output.flush()
+        while True:
+            lines = reader.read_batch()
+            if not lines:
+                break
+            requests = []
+            for raw in lines:
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    requests.append(_json_loads(line))
+                except Exception:
+                    continue
+            # One write and one flush per batch: the batch holds every line
+            # stdin had ready, so the next read is where we would block.
+            if sink is not None:
+                chunks = [
+                    _json_line(response)
+                    for response in self._handle_batch(requests)
+                    if response is not None
+                ]
+                if chunks:
+                    sink.write(b"".join(chunks))
+                    sink.flush()
+            else:
+                texts = [
+                    _json_dumps(response) + "\n"
+                    for response in self._handle_batch(requests)
+                    if response is not None
+                ]
+                if texts:
+                    output.write("".join(texts))
+                    output.flush()
 
-    def _handle_request(self, request: dict) -> Optional[dict]:
+    def _handle_batch(self, requests: list) -> Iterator[Optional[dict]]:
+        """Answer ``requests`` in order, pipelining consecutive kernel calls.
+
+        Runs of vars/preview requests are all submitted before the first one is
+        collected, so the kernel never idles waiting for the next request.
+        Anything else (exec, debug previews) waits for the run before it, so
+        results still reflect request order.
+        """
+        submit = getattr(self._channel, "submit", None)
+        if submit is None or len(requests) < 2:
+            for request in requests:
+                yield self._handle_request(request)
+            return
+        staged: list = []
+        for request in requests:
+            stage = self._stage(request)
+            if stage is not None:
+                expr, finish = stage
+                staged.append((submit(_REQUEST_CELL, user_expression=expr), finish))
+                continue
+            yield from self._finish_staged(staged)
+            yield self._handle_request(request)
+        yield from self._finish_staged(staged)
+
+    def _finish_staged(self, staged: list) -> Iterator[dict]:
+        for pending, finish in staged:
+            yield finish(self._channel.collect(pending))
+        staged.clear()
+
+    def _stage(self, request: dict) -> Optional[Tuple[str, Callable[[tuple], dict]]]:
+        """Return ``(expression, finish)`` for requests that are a single kernel call."""
         req_id = request.get("id")
         op = request.get("op")
         args = request.get("args") or {}
-        if op == "ping":
-            return {"id": req_id, "ok": True, "tag": "pong"}
         if op == "vars":
-            return self._handle_vars(req_id, args)
-        if op == "preview":
-            return self._handle_preview(req_id, args)
-        if op == "exec":
-            return self._handle_exec(req_id, args)
-        return {"id": req_id, "ok": False, "error": "unknown op"}
+            key, expr = self._vars_request(args)
+            return expr, partial(self._vars_response, req_id, key)
+        if op == "preview" and not args.get("debug"):
+            window = self._preview_window(args)
+            return self._preview_request(window), partial(self._preview_response, req_id, window[0])
+        return None
+
+    def _handle_request(self, request: dict) -> Optional[dict]:
+        req_id = request.get("id")
+        op = request.get("op")
+        handler = self._handlers.get(op) if isinstance(op, str) else None
+        if handler is None:
+            return {"id": req_id, "ok": False, "error": "unknown op"}
+        return handler(req_id, request.get("args") or {})
+
+    @staticmethod
+    def _handle_ping(req_id, args: dict) -> dict:
+        return {"id": req_id, "ok": True, "tag": "pong"}
 
     def _handle_vars(self, req_id, args: dict) -> dict:
+        key, expr = self._vars_request(args)
+        result = self._channel.run_and_collect(_REQUEST_CELL, user_expression=expr)
+        return self._vars_response(req_id, key, result)
+
+    def _vars_request(self, args: dict) -> Tuple[tuple, str]:
+        """Return the cache key and kernel expression for a vars request.
+
+        The token of the last listing for the same arguments is sent along so
+        the kernel can answer "unchanged" instead of re-describing everything.
+        """
         max_repr = int(args.get("max_repr", 120))
         hide_names = args.get("hide_names") or []
         hide_types = args.get("hide_types") or []
-        hn_expr = json.dumps(hide_names, ensure_ascii=False)
-        ht_expr = json.dumps(hide_types, ensure_ascii=False)
-        code = (
-            f"__mi_list_vars(max_repr={max_repr}, hide_names={hn_expr}, "
-            f"hide_types={ht_expr})"
-        )
-        ok, data, err = self._channel.run_and_collect(code)
-        self._logger.log(f"vars ok={ok} size={0 if not data else len(data)}")
+        hn_expr, ht_expr = self._filter_expressions(hide_names, hide_types)
+        key = (max_repr, hn_expr, ht_expr)
+        cached = self._vars_cache
+        token = _json_dumps(cached[1]) if cached is not None and cached[0] == key else "null"
+        return key, _REQUEST_EXPR % (_VARS_REQUEST % (token, max_repr, hn_expr, ht_expr))
+
+    def _vars_response(self, req_id, key: tuple, result: tuple) -> dict:
+        ok, data, err = result
+        if ok:
+            ok, data, err = self._resolve_vars(key, data)
+        if self._verbose:
+            self._logger.log(f"vars ok={ok} size={0 if not data else len(data)}")
         response = {"id": req_id, "ok": ok, "tag": "vars"}
         if ok:
             response["data"] = data
@@ -434,6 +1157,31 @@ class RequestProcessor:
             response["error"] = err or "error"
         return response
 
+    def _resolve_vars(self, key: tuple, payload: Any) -> Tuple[bool, Optional[dict], Optional[str]]:
+        if not isinstance(payload, dict):
+            return False, None, "malformed vars payload"
+        token = payload.get("token")
+        if payload.get("unchanged"):
+            cached = self._vars_cache
+            if cached is not None and cached[0] == key and cached[1] == token:
+                return True, cached[2], None
+            self._vars_cache = None
+            return False, None, "stale vars cache"
+        data = payload.get("vars")
+        if not isinstance(data, dict):
+            return False, None, "malformed vars payload"
+        self._vars_cache = (key, token, data) if token else None
+        return True, data, None
+
+    def _filter_expressions(self, hide_names: list, hide_types: list) -> Tuple[str, str]:
+        cached = self._filter_exprs
+        if cached is not None and cached[0] == hide_names and cached[1] == hide_types:
+            return cached[2], cached[3]
+        hn_expr = _json_dumps(hide_names)
+        ht_expr = _json_dumps(hide_types)
+        self._filter_exprs = (hide_names, hide_types, hn_expr, ht_expr)
+        return hn_expr, ht_expr
+
     def _handle_exec(self, req_id, args: dict) -> dict:
         code = args.get("code")
         if not isinstance(code, str):
@@ -444,9 +1192,9 @@ class RequestProcessor:
             response["error"] = err or "error"
         return response
 
-    def _handle_preview(self, req_id, args: dict) -> dict:
-        name = args.get("name") or ""
-        debug_mode = bool(args.get("debug"))
+    @staticmethod
+    def _preview_window(args: dict) -> Tuple[str, int, int, int, int]:
+        """Return ``(name, max_rows, max_cols, row_offset, col_offset)``."""
         def _int(value, default=0):
             try:
                 if value is None:
@@ -455,6 +1203,7 @@ class RequestProcessor:
             except Exception:
                 return default
 
+        name = args.get("name") or ""
         max_rows = _int(args.get("max_rows"), 30)
         max_cols = _int(args.get("max_cols"), 20)
         row_offset = _int(args.get("row_offset"), 0)
@@ -463,15 +1212,31 @@ class RequestProcessor:
             row_offset = 0
         if col_offset < 0:
             col_offset = 0
+        return name, max_rows, max_cols, row_offset, col_offset
+
+    def _debug_preview_code(self, window: Tuple[str, int, int, int, int]) -> str:
+        name, max_rows, max_cols, row_offset, col_offset = window
         name_esc = str(name).replace("'", "\\'")
-        if debug_mode:
-            ok, data, err = self._preview.request(name, max_rows, max_cols, row_offset, col_offset)
+        code = _DEBUG_PREVIEW_CODE % (name_esc, max_rows, max_cols, row_offset, col_offset)
+        if self._verbose:
+            self._logger.log(f"preview exec code={KernelChannel._shorten(code)}")
+        return code
+
+    def _preview_request(self, window: Tuple[str, int, int, int, int]) -> str:
+        name, max_rows, max_cols, row_offset, col_offset = window
+        body = _PREVIEW_REQUEST % (_json_dumps(str(name)), max_rows, max_cols, row_offset, col_offset)
+        expr = _REQUEST_EXPR % body
+        if self._verbose:
+            self._logger.log(f"preview request={KernelChannel._shorten(expr)}")
+        return expr
+
+    def _handle_preview(self, req_id, args: dict) -> dict:
+        window = self._preview_window(args)
+        if args.get("debug"):
+            ok, data, err = self._preview.request(*window)
             if not ok:
                 self._logger.log(f"debug preview socket fallback err={err}")
-                code = (
-                    f"__mi_debug_preview('{name_esc}', max_rows={max_rows}, "
-                    f"max_cols={max_cols}, row_offset={row_offset}, col_offset={col_offset})"
-                )
+                code = self._debug_preview_code(window)
                 ok, data, err = self._channel.run_and_collect(code)
             response = {"id": req_id, "ok": bool(ok), "tag": "preview"}
             if ok and data is not None:
@@ -480,18 +1245,22 @@ class RequestProcessor:
                 response["error"] = err or "debug preview failed"
             return response
 
-        code = (
-            f"__mi_preview('{name_esc}', max_rows={max_rows}, max_cols={max_cols}, row_offset={row_offset}, col_offset={col_offset})"
-        )
-        self._logger.log(
-            f"preview exec code={KernelChannel._shorten(code)} debug={debug_mode}"
-        )
-        ok, data, err = self._channel.run_and_collect(code)
-        self._logger.log(
-            f"preview name={name!r} ok={ok} err={bool(err)} data_none={data is None}"
-        )
-        if data is not None:
-            self._logger.log(f"preview data keys={list(data.keys())}")
+        result = self._channel.run_and_collect(_REQUEST_CELL, user_expression=self._preview_request(window))
+        return self._preview_response(req_id, window[0], result)
+
+    def _preview_response(self, req_id, name: str, result: tuple) -> dict:
+        ok, data, err = result
+        if ok:
+            try:
+                data = _expand_packed_preview(data)
+            except Exception as exc:
+                ok, data, err = False, None, f"decode error: {exc}"
+        if self._verbose:
+            self._logger.log(
+                f"preview name={name!r} ok={ok} err={bool(err)} data_none={data is None}"
+            )
+            if data is not None:
+                self._logger.log(f"preview data keys={list(data.keys())}")
         response = {"id": req_id, "ok": ok, "tag": "preview"}
         if ok:
             response["data"] = data
@@ -530,7 +1299,9 @@ def main() -> int:
     channel.connect(opts.conn_file, bootstrap.build(opts.debug))
     preview_client = DebugPreviewClient(channel, logger)
     processor = RequestProcessor(channel, preview_client, logger)
-    processor.process_stream(sys.stdin, sys.stdout)
+    # Read raw bytes: the JSON decoder takes UTF-8 directly, so the
+    # TextIOWrapper decode per line is wasted work.
+    processor.process_stream(getattr(sys.stdin, "buffer", sys.stdin), sys.stdout)
     return None
 
 
@@ -55,16 +55,14 @@ if _PATCH_FLAG:
         _session = None
         _log(f"prompt_toolkit unavailable: {exc}")
 
+    _get_running_loop = asyncio.events._get_running_loop
+
     def _patched_input(prompt_text: str = "") -> str:
         """Wrapper around input() that prefers prompt_toolkit for key handling."""
         global _input_failure_logged
-        loop_running = False
-        try:
-            asyncio.get_running_loop()
-            loop_running = True
-        except RuntimeError:
-            loop_running = False
-        if _session is not None and not loop_running:
+        # _get_running_loop() returns None instead of raising RuntimeError,
+        # which keeps the common no-loop case free of exception handling.
+        if _session is not None and _get_running_loop() is None:
             try:
                 return _session.prompt(prompt_text)
             except (EOFError, KeyboardInterrupt):
@@ -1,25 +1,33 @@
 """Synchronise variable explorer filters inside the kernel."""
 
-import json
-import sys
 
-try:
-    _myipy_sync_var_filters
-    _myipy_set_debug_logging
-except NameError:  # pragma: no cover
-    raise RuntimeError("ipybridge bootstrap helpers are not loaded")
+def _mi_sync_filters(args_json):
+    # Everything stays local so the user namespace only sees this function,
+    # and only until the cell finishes.
+    import json
+    import sys
 
-_names = json.loads(r'''__NAMES_JSON__''')
-_types = json.loads(r'''__TYPES_JSON__''')
-_max_repr = __MAX_REPR__
-_enable_logs = __ENABLE_LOGS__
+    g = globals()
+    sync_fn = g.get('_myipy_sync_var_filters')
+    set_debug = g.get('_myipy_set_debug_logging')
+    if sync_fn is None or set_debug is None:  # pragma: no cover
+        raise RuntimeError("ipybridge bootstrap helpers are not loaded")
+
+    args = json.loads(args_json)
+    try:
+        sync_fn(args.get('names'), args.get('types'), args.get('max_repr'))
+    except Exception as exc:
+        sys.stderr.write('[ipybridge] sync filters failed: %s\n' % (exc,))
+
+    try:
+        set_debug(bool(args.get('enable_logs')))
+    except Exception:
+        pass
 
-try:
-    _myipy_sync_var_filters(_names, _types, _max_repr)
-except Exception as exc:
-    sys.stderr.write('[ipybridge] sync filters failed: %s\n' % (exc,))
 
+# The client prepends a ``__mi_sync_args = '<json>'`` line holding the
+# arguments; without it the helpers fall back to their defaults.
 try:
-    _myipy_set_debug_logging(_enable_logs)
-except Exception:
-    pass
+    _mi_sync_filters(globals().pop('__mi_sync_args', '{}'))
+finally:
+    del _mi_sync_filters
@@ -1,6 +1,27 @@
+import importlib
+import importlib.util
 import sys
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope='session')
+def kernel_client_module():
+    python_dir = str(ROOT / 'python')
+    if python_dir not in sys.path:
+        sys.path.insert(0, python_dir)
+    return importlib.import_module('myipy_kernel_client')
+
+
+@pytest.fixture(scope='module')
+def ns_module():
+    module_path = ROOT / 'python' / 'ipybridge_ns.py'
+    spec = importlib.util.spec_from_file_location('ipybridge_ns_fixture', module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
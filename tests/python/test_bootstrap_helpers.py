@@ -0,0 +1,41 @@
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+HELPERS_PATH = Path(__file__).resolve().parents[2] / 'python' / 'bootstrap_helpers.py'
+
+
+@pytest.fixture
+def helpers(monkeypatch, ns_module):
+    # The prelude reuses an already loaded ipybridge_ns, so MODULE_B64 is never decoded.
+    monkeypatch.setitem(sys.modules, 'ipybridge_ns', ns_module)
+    namespace = {'__name__': 'ipybridge_prelude_test'}
+    exec(compile(HELPERS_PATH.read_text(), str(HELPERS_PATH), 'exec'), namespace)
+    return namespace
+
+
+def _recv_frame(sock, header):
+    head = sock.recv(header.size, socket.MSG_WAITALL)
+    (length,) = header.unpack(head)
+    return sock.recv(length, socket.MSG_WAITALL)
+
+
+def test_debug_preview_server_rejects_oversized_request(helpers):
+    server = helpers['_DebugPreviewServer'](helpers['_DebugPreviewContext']())
+    header = helpers['_PREVIEW_FRAME_HEADER']
+    client, conn = socket.socketpair()
+    worker = threading.Thread(target=server._serve_connection, args=(conn,), daemon=True)
+    worker.start()
+    try:
+        client.sendall(header.pack(helpers['_PREVIEW_MAX_REQUEST'] + 1))
+        body = _recv_frame(client, header)
+        worker.join(timeout=5)
+        assert b'"ok":false' in body
+        assert b'request too large' in body
+        assert not worker.is_alive()
+        assert client.recv(1) == b''
+    finally:
+        client.close()
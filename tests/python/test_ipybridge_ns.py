@@ -1,17 +1,17 @@
-import importlib.util
-from pathlib import Path
+import gc
 
+import pytest
 
-def load_ns_module():
-    module_path = Path(__file__).resolve().parents[2] / 'python' / 'ipybridge_ns.py'
-    spec = importlib.util.spec_from_file_location('ipybridge_ns_test', module_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
 
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch, ns_module):
+    # ns_module is shared by this file; each test gets its own filters and version counter.
+    monkeypatch.setattr(ns_module, '_FILTERS', dict(ns_module._FILTERS))
+    monkeypatch.setattr(ns_module, '_NS_VERSION', dict(ns_module._NS_VERSION))
 
-def test_list_variables_filters_names_and_types():
-    mod = load_ns_module()
+
+def test_list_variables_filters_names_and_types(ns_module):
+    mod = ns_module
     mod.set_var_filters(names=['skip_me'], types_=['Custom'], max_repr=10)
     class Custom:
         pass
@@ -28,8 +28,8 @@ def test_list_variables_filters_names_and_types():
     assert result['other']['repr'].endswith('...') is False
 
 
-def test_resolve_path_handles_index_and_attribute():
-    mod = load_ns_module()
+def test_resolve_path_handles_index_and_attribute(ns_module):
+    mod = ns_module
     ns = {
         'item': {'child': [10, 20, 30]},
     }
@@ -39,10 +39,181 @@ def test_resolve_path_handles_index_and_attribute():
     assert err is None
 
 
-def test_preview_data_with_sequence():
-    mod = load_ns_module()
+def test_preview_data_with_sequence(ns_module):
+    mod = ns_module
     ns = {'numbers': list(range(5))}
     preview = mod.preview_data('numbers', namespace=ns, max_rows=3)
     assert preview['name'] == 'numbers'
     assert preview['kind'] == 'object'
     assert 'values1d' in preview or 'repr' in preview
+
+
+def test_namespace_token_tracks_executions_and_names(ns_module):
+    mod = ns_module
+    assert mod.namespace_token({'a': 1}) is None
+
+    class FakeEvents:
+        def __init__(self):
+            self.callbacks = {}
+
+        def register(self, event, callback):
+            self.callbacks.setdefault(event, []).append(callback)
+
+    events = FakeEvents()
+    shell = type('Shell', (), {'events': events})()
+    assert mod.install_version_hook(shell) is True
+    assert mod.install_version_hook(shell) is True
+    (post_execute,) = events.callbacks['post_execute']
+
+    token = mod.namespace_token({'a': 1})
+    mod.mark_helper_execution()
+    post_execute()
+    assert mod.namespace_token({'a': 2}) == token
+    assert mod.namespace_token({'a': 1, 'b': 2}) != token
+    post_execute()
+    assert mod.namespace_token({'a': 1}) != token
+
+
+def test_list_variables_summarizes_large_dataframes(ns_module):
+    pd = pytest.importorskip('pandas')
+    mod = ns_module
+    ns = {
+        'small': pd.DataFrame({'a': [1, 2]}),
+        'wide': pd.DataFrame({f'c{i}': range(20) for i in range(10)}),
+    }
+    result = mod.list_variables(ns, max_repr=200)
+    assert result['small']['repr'] == repr(ns['small'])
+    assert result['wide']['repr'] == (
+        "columns: ['c0', 'c1', 'c2', 'c3', 'c4', 'c5', 'c6', 'c7', ...]"
+    )
+    assert result['wide']['shape'] == [20, 10]
+
+
+def test_preview_data_dataframe_rows_mask_missing_cells(ns_module):
+    pd = pytest.importorskip('pandas')
+    mod = ns_module
+    frame = pd.DataFrame({
+        'f': [1.5, float('nan')],
+        'i': [1, 2],
+        's': ['a', None],
+        't': pd.to_datetime(['2020-01-01', None]),
+    })
+    preview = mod.preview_data('df', namespace={'df': frame})
+    assert preview['rows'] == [
+        [1.5, 1, 'a', '2020-01-01 00:00:00'],
+        [None, 2, None, None],
+    ]
+    packed = mod.preview_data('df', namespace={'df': frame}, packed=True)
+    assert packed['packed_columns'][2] == {'values': ['a', None]}
+
+
+def test_list_variables_dataframe_dtype_follows_mutation(ns_module):
+    pd = pytest.importorskip('pandas')
+    mod = ns_module
+    frame = pd.DataFrame({'a': [1, 2], 'b': [0.5, 1.5]})
+    ns = {'df': frame}
+    assert mod.list_variables(ns)['df']['dtype'] == str(frame.dtypes.to_dict())
+    frame['a'] = frame['a'].astype(str)
+    frame['c'] = 1
+    assert mod.list_variables(ns)['df']['dtype'] == str(frame.dtypes.to_dict())
+    preview = mod.preview_data('df', namespace=ns, max_cols=2, col_offset=1)
+    assert preview['columns'] == ['b', 'c']
+    key = id(frame)
+    assert key in mod._FRAME_META
+    del ns['df'], frame
+    gc.collect()
+    assert key not in mod._FRAME_META
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_preview_data_dataframe_leaves_source_frame_untouched(packed, ns_module):
+    pd = pytest.importorskip('pandas')
+    mod = ns_module
+    frame = pd.DataFrame({
+        'o': pd.Series(['a', None, float('nan')], dtype=object),
+        's': pd.Series(['x', pd.NA, 'z'], dtype='string'),
+        'm': pd.Series([pd.Timestamp('2020-01-01'), 'b', pd.NA], dtype=object),
+    })
+    original = frame.copy(deep=True)
+    preview = mod.preview_data('df', namespace={'df': frame}, packed=packed)
+    assert 'error' not in preview
+    assert frame.equals(original)
+    assert frame['s'].isna().tolist() == [False, True, False]
+    assert frame.loc[1, 's'] is pd.NA
+    assert frame.loc[0, 'm'] == pd.Timestamp('2020-01-01')
+
+
+def test_list_variables_matches_prefix_patterns_literally(ns_module):
+    mod = ns_module
+    ns = {'tmp_a': 1, 'tmpb': 2, 'keep': 3, 'a?': 4, 'ab': 5}
+    result = mod.list_variables(ns, hide_names=['tmp_*', 'a?'], hide_types=[])
+    assert sorted(result) == ['ab', 'keep', 'tmpb']
+    again = mod.list_variables(ns, hide_names=['tmp_*', 'a?'], hide_types=['int'])
+    assert again == {}
+
+
+def test_list_variables_skips_unhashable_hide_patterns(ns_module):
+    mod = ns_module
+    ns = {'tmp_a': 1, 'secret': 2, 'keep': 3}
+    result = mod.list_variables(ns, hide_names=['tmp_*', ['nested'], 'secret', 7], hide_types=[])
+    assert sorted(result) == ['keep']
+
+
+def test_preview_data_ctypes_structure_with_bitfields_and_nesting(ns_module):
+    import ctypes
+
+    mod = ns_module
+
+    class Inner(ctypes.Structure):
+        _fields_ = [('x', ctypes.c_int), ('arr', ctypes.c_double * 3)]
+
+    class Outer(ctypes.Structure):
+        _fields_ = [('flags', ctypes.c_uint, 3), ('inner', Inner), ('many', Inner * 4)]
+
+    value = Outer()
+    value.flags = 5
+    value.inner.x = 7
+    preview = mod.preview_data('value', namespace={'value': value}, max_cols=2)
+    fields = {field['name']: field for field in preview['fields']}
+    assert fields['flags']['value'] == 5
+    assert fields['inner']['value'] == {'x': 7, 'arr': [0.0, 0.0, '...(+1 more)']}
+    assert fields['many']['length'] == 4
+    assert fields['many']['elem_ctype'] == 'Inner'
+    assert len(fields['many']['values']) == 3
+
+
+@pytest.mark.parametrize('ctype, init', [
+    ('c_float', [1.1, -2.5, 3.0]),
+    ('c_int', [1, -2, 3]),
+    ('c_ulonglong', [1, 2 ** 63, 3]),
+    ('c_bool', [True, False, True]),
+    ('c_char', [b'a', b'b', b'c']),
+])
+def test_preview_data_ctypes_array_matches_element_values(ctype, init, ns_module):
+    import ctypes
+
+    mod = ns_module
+    value = (getattr(ctypes, ctype) * 3)(*init)
+    preview = mod.preview_data('value', namespace={'value': value}, max_rows=2)
+    assert preview['values'] == [value[0], value[1], '...(+1 more)']
+    assert [type(item) for item in preview['values'][:2]] == [type(value[0])] * 2
+
+
+def test_list_variables_truncates_long_strings_like_repr(ns_module):
+    mod = ns_module
+    text = "it's\n" * 1000
+    result = mod.list_variables({'text': text, 'data': b'\xff' * 500}, max_repr=40)
+    assert result['text']['repr'] == repr(text)[:40] + '...'
+    assert result['data']['repr'] == repr(b'\xff' * 500)[:40] + '...'
+
+
+@pytest.mark.parametrize('value', [
+    "it's" + 'x' * 200 + '"',
+    "it's" + 'x' * 200,
+    'x' * 200 + "'",
+    b"it's" + b'x' * 200 + b'"',
+])
+def test_list_variables_truncates_mixed_quote_strings_like_repr(value, ns_module):
+    mod = ns_module
+    result = mod.list_variables({'value': value}, max_repr=40)
+    assert result['value']['repr'] == repr(value)[:40] + '...'
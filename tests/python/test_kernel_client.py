@@ -1,54 +1,64 @@
-import builtins
-import importlib.util
 import io
 import json
+import os
+import pickle
+import socket
 import sys
+import threading
 import types
-from pathlib import Path
 
 import pytest
 
 
-def load_kernel_client():
-    module_path = Path(__file__).resolve().parents[2] / 'python' / 'myipy_kernel_client.py'
-    spec = importlib.util.spec_from_file_location('myipy_kernel_client_test', module_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
+_MISSING_JUPYTER_LINE = '{"id": "0", "ok": false, "error": "jupyter_client missing"}\n'
 
 
-def test_main_reports_missing_jupyter(monkeypatch, tmp_path, capsys):
-    module = load_kernel_client()
-    conn = tmp_path / 'conn.json'
-    conn.write_text('{}')
+class _EmptyStdin:
+    """Closed stdin for main(); no fileno, so the request loop uses readline."""
 
-    monkeypatch.setattr(module.sys, 'argv', ['prog', '--conn-file', str(conn)])
-    monkeypatch.setattr(module.sys, 'stdin', io.StringIO(''))
+    def readline(self, *args, **kwargs):
+        return ''
+
+
+class _StreamSink:
+    """Text stream stand-in that keeps each write() as one entry."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture(scope='session')
+def empty_conn(tmp_path_factory):
+    path = tmp_path_factory.mktemp('conn') / 'conn.json'
+    path.write_text('{}')
+    return path
 
-    original_import = builtins.__import__
 
-    def fake_import(name, globals=None, locals=None, fromlist=(), level=0):
-        if name == 'jupyter_client':
-            raise ImportError('missing jupyter_client')
-        return original_import(name, globals, locals, fromlist, level)
+def test_main_reports_missing_jupyter(monkeypatch, empty_conn, capsys, kernel_client_module):
+    module = kernel_client_module
+    conn = empty_conn
+    monkeypatch.setattr(module.sys, 'argv', ['prog', '--conn-file', str(conn)])
+    monkeypatch.setattr(module.sys, 'stdin', _EmptyStdin())
 
-    monkeypatch.setattr(builtins, '__import__', fake_import)
+    monkeypatch.setitem(sys.modules, 'jupyter_client', None)
 
     exit_code = module.main()
     captured = capsys.readouterr()
 
     assert exit_code == 1
-    payload = json.loads(captured.out.strip())
-    assert payload['ok'] is False
-    assert payload['error'] == 'jupyter_client missing'
+    assert captured.out == _MISSING_JUPYTER_LINE
     assert captured.err == ''
 
 
-def test_main_runs_with_stubbed_kernel(monkeypatch, tmp_path, capsys):
-    module = load_kernel_client()
-    conn = tmp_path / 'conn.json'
-    conn.write_text('{}')
-
+def test_main_runs_with_stubbed_kernel(monkeypatch, empty_conn, kernel_client_module):
+    module = kernel_client_module
+    conn = empty_conn
     class FakeKC:
         def __init__(self):
             self.loaded = None
@@ -81,20 +91,22 @@ def test_main_runs_with_stubbed_kernel(monkeypatch, tmp_path, capsys):
 
     monkeypatch.setitem(sys.modules, 'jupyter_client', stub_module)
     monkeypatch.setattr(module.sys, 'argv', ['prog', '--conn-file', str(conn), '--debug'])
-    monkeypatch.setattr(module.sys, 'stdin', io.StringIO(''))
+    monkeypatch.setattr(module.sys, 'stdin', _EmptyStdin())
+    out, err = _StreamSink(), _StreamSink()
+    monkeypatch.setattr(module.sys, 'stdout', out)
+    monkeypatch.setattr(module.sys, 'stderr', err)
 
     result = module.main()
-    captured = capsys.readouterr()
 
     assert result is None
-    assert '[myipy.zmq] channels started' in captured.err
-    assert '[myipy.zmq] prelude ready' in captured.err
-    assert captured.out == ''
+    assert '[myipy.zmq] channels started\n' in err.lines
+    assert '[myipy.zmq] prelude ready\n' in err.lines
+    assert out.lines == []
 
     fake = stub_module.last_instance
     assert fake.loaded == str(conn)
     assert fake.started is True
-    assert fake.executed and '__mi_list_vars' in fake.executed[0]
+    assert fake.executed and '__IPYBRIDGE_PRELUDE__' in fake.executed[0]
 
 
 class DummyLogger:
@@ -105,21 +117,22 @@ class DummyLogger:
         self.messages.append(message)
 
 
-class FakeClientSuccess:
-    def __init__(self):
+_STREAM_TEMPLATE = {'msg_type': 'stream', 'content': {'name': 'stdout', 'text': '{"answer": 42}'}}
+_IDLE_TEMPLATE = {'msg_type': 'status', 'content': {'execution_state': 'idle'}}
+_ERROR_TEMPLATE = {'msg_type': 'error', 'content': {'traceback': ['Traceback', 'ValueError: boom']}}
+
+
+def _iopub_reply(msg_id, *templates):
+    return [{**template, 'parent_header': {'msg_id': msg_id}} for template in templates]
+
+
+class FakeClient:
+    """Kernel client stub; ``mode='error'`` makes every execute fail with ValueError."""
+
+    def __init__(self, mode='ok'):
+        self.mode = mode
         self.executed = []
-        self._iopub_msgs = [
-            {
-                'parent_header': {'msg_id': 'msg1'},
-                'msg_type': 'stream',
-                'content': {'name': 'stdout', 'text': '{"answer": 42}'},
-            },
-            {
-                'parent_header': {'msg_id': 'msg1'},
-                'msg_type': 'status',
-                'content': {'execution_state': 'idle'},
-            },
-        ]
+        self._iopub_msgs = _iopub_reply('msg1', _STREAM_TEMPLATE, _IDLE_TEMPLATE)
 
     def load_connection_file(self, path):
         self.loaded = path
@@ -129,20 +142,13 @@ class FakeClientSuccess:
 
     def execute(self, code, **kwargs):
         self.executed.append((code, kwargs))
+        if self.mode == 'error':
+            msg_id = f'err{len(self.executed)}'
+            self._iopub_msgs = _iopub_reply(msg_id, _ERROR_TEMPLATE)
+            return msg_id
         msg_id = f'msg{len(self.executed)}'
         if 'print(42)' in code or not self._iopub_msgs:
-            self._iopub_msgs = [
-                {
-                    'parent_header': {'msg_id': msg_id},
-                    'msg_type': 'stream',
-                    'content': {'name': 'stdout', 'text': '{"answer": 42}'},
-                },
-                {
-                    'parent_header': {'msg_id': msg_id},
-                    'msg_type': 'status',
-                    'content': {'execution_state': 'idle'},
-                },
-            ]
+            self._iopub_msgs = _iopub_reply(msg_id, _STREAM_TEMPLATE, _IDLE_TEMPLATE)
         return msg_id
 
     def get_iopub_msg(self, timeout=None):
@@ -151,26 +157,11 @@ class FakeClientSuccess:
         raise Exception('idle reached')
 
     def get_shell_msg(self, timeout=None):
+        if self.mode == 'error':
+            return {'content': {'status': 'error', 'ename': 'ValueError', 'evalue': 'boom'}}
         return {'content': {'status': 'ok'}}
 
 
-class FakeClientError(FakeClientSuccess):
-    def execute(self, code, **kwargs):
-        self.executed.append((code, kwargs))
-        msg_id = f'err{len(self.executed)}'
-        self._iopub_msgs = [
-            {
-                'parent_header': {'msg_id': msg_id},
-                'msg_type': 'error',
-                'content': {'traceback': ['Traceback', 'ValueError: boom']},
-            },
-        ]
-        return msg_id
-
-    def get_shell_msg(self, timeout=None):
-        return {'content': {'status': 'error', 'ename': 'ValueError', 'evalue': 'boom'}}
-
-
 class DummyPreview:
     def __init__(self, result):
         self.result = result
@@ -187,13 +178,37 @@ class DummyChannel:
         self.calls = []
 
     def run_and_collect(self, code, **kwargs):
-        self.calls.append(code)
+        self.calls.append(kwargs.get('user_expression') or code)
         return self.payload
 
 
-def test_kernel_channel_run_and_collect_success(monkeypatch):
-    module = load_kernel_client()
-    channel = module.KernelChannel(lambda: FakeClientSuccess(), DummyLogger())
+@pytest.mark.parametrize('mode, expected', [
+    ('ok', (True, {'answer': 42}, None)),
+    ('error', (False, None, 'ValueError')),
+])
+def test_kernel_channel_run_and_collect(mode, expected, kernel_client_module):
+    module = kernel_client_module
+    channel = module.KernelChannel(lambda: FakeClient(mode), DummyLogger())
+    channel.connect('conn.json', 'print(1)')
+    ok, data, err = channel.run_and_collect('print(42)')
+    assert (ok, data) == expected[:2]
+    if expected[2] is None:
+        assert err is None
+    else:
+        assert expected[2] in err
+
+
+def test_kernel_channel_waits_out_quiet_iopub_gap(kernel_client_module):
+    module = kernel_client_module
+
+    class SlowClient(FakeClient):
+        def get_iopub_msg(self, timeout=None):
+            # A cell that stays quiet for a while must not end collection early.
+            if timeout is not None and timeout < 1.0:
+                raise Exception('quiet gap')
+            return super().get_iopub_msg(timeout=timeout)
+
+    channel = module.KernelChannel(lambda: SlowClient(), DummyLogger())
     channel.connect('conn.json', 'print(1)')
     ok, data, err = channel.run_and_collect('print(42)')
     assert ok is True
@@ -201,49 +216,525 @@ def test_kernel_channel_run_and_collect_success(monkeypatch):
     assert err is None
 
 
-def test_kernel_channel_run_and_collect_error(monkeypatch):
-    module = load_kernel_client()
-    channel = module.KernelChannel(lambda: FakeClientError(), DummyLogger())
-    channel.connect('conn.json', 'print(1)')
-    ok, data, err = channel.run_and_collect('print(42)')
-    assert ok is False
-    assert data is None
-    assert 'ValueError' in err
+def test_kernel_channel_accepts_application_json_user_expression(kernel_client_module):
+    module = kernel_client_module
+
+    class ExprClient(FakeClient):
+        def execute(self, code, **kwargs):
+            msg_id = super().execute(code, **kwargs)
+            self._iopub_msgs = [{
+                'parent_header': {'msg_id': msg_id},
+                'msg_type': 'status',
+                'content': {'execution_state': 'idle'},
+            }]
+            return msg_id
 
+        def get_shell_msg(self, timeout=None):
+            msg_id = f'msg{len(self.executed)}'
+            expr = {'status': 'ok', 'data': {'application/json': {'token': '1', 'vars': {}}, 'text/plain': ''}}
+            return {
+                'parent_header': {'msg_id': msg_id},
+                'content': {'status': 'ok', 'user_expressions': {'_': expr}},
+            }
 
-def test_request_processor_debug_preview_fallback(monkeypatch):
-    module = load_kernel_client()
+    channel = module.KernelChannel(ExprClient, DummyLogger())
+    channel.connect('conn.json', 'print(1)')
+    ok, data, err = channel.run_and_collect(module._REQUEST_CELL, user_expression='__mi_request("{}")')
+    code, kwargs = channel.client.executed[-1]
+
+    assert (ok, data, err) == (True, {'token': '1', 'vars': {}}, None)
+    assert kwargs['silent'] is True
+    assert kwargs['user_expressions'] == {'_': '__mi_request("{}")'}
+
+
+@pytest.mark.parametrize('debug, preview_result, expected_call', [
+    (
+        True,
+        (False, None, 'socket error'),
+        "__mi_debug_preview('foo', max_rows=5, max_cols=4, row_offset=2, col_offset=1)",
+    ),
+    (
+        False,
+        (True, {'ok': True}, None),
+        '__mi_request(\'{"op":"preview","name":"foo","max_rows":5,"max_cols":4,'
+        '"row_offset":2,"col_offset":1}\')',
+    ),
+])
+def test_request_processor_preview(debug, preview_result, expected_call, kernel_client_module):
+    module = kernel_client_module
     channel = DummyChannel((True, {'name': 'foo'}, None))
-    preview = DummyPreview((False, None, 'socket error'))
+    preview = DummyPreview(preview_result)
     processor = module.RequestProcessor(channel, preview, DummyLogger())
     response = processor._handle_preview('1', {
         'name': 'foo',
-        'debug': True,
+        'debug': debug,
         'max_rows': 5,
         'max_cols': 4,
-        'row_offset': 0,
-        'col_offset': 0,
+        'row_offset': 2,
+        'col_offset': 1,
     })
-    assert preview.calls
-    assert any('__mi_debug_preview' in code for code in channel.calls)
+    assert preview.calls == ([('foo', 5, 4, 2, 1)] if debug else [])
+    assert channel.calls == [expected_call]
     assert response['ok'] is True
     assert response['data'] == {'name': 'foo'}
 
 
-def test_request_processor_preview_exec(monkeypatch):
-    module = load_kernel_client()
-    payload = (True, {'name': 'bar'}, None)
-    channel = DummyChannel(payload)
-    preview = DummyPreview((True, {'ok': True}, None))
-    processor = module.RequestProcessor(channel, preview, DummyLogger())
-    response = processor._handle_preview('2', {
-        'name': 'bar',
-        'debug': False,
-        'max_rows': 10,
-        'max_cols': 3,
-        'row_offset': 2,
-        'col_offset': 1,
+def test_kernel_channel_parses_connection_file_once(tmp_path, kernel_client_module):
+    module = kernel_client_module
+    conn = tmp_path / 'conn.json'
+    conn.write_text('{"shell_port": 1234, "key": "abc"}')
+
+    class InfoClient(FakeClient):
+        def load_connection_info(self, info):
+            self.info = info
+
+    channel = module.KernelChannel(InfoClient, DummyLogger())
+    channel.connect(str(conn), 'print(1)')
+    first = channel.client.info
+    conn.unlink()
+    channel.connect(str(conn), 'print(1)')
+    assert first == {'shell_port': 1234, 'key': 'abc'}
+    assert channel.client.info is first
+
+
+def test_bootstrap_prelude_skips_helpers_on_warm_kernel(tmp_path, kernel_client_module):
+    module = kernel_client_module
+    ns_path = tmp_path / 'ns.py'
+    ns_path.write_text('')
+    helpers = tmp_path / 'helpers.py'
+    helpers.write_text(
+        'RUNS.append(1)\n'
+        'def _myipy_set_debug_logging(flag):\n'
+        '    pass\n'
+        'class _Server:\n'
+        '    def ensure_running(self):\n'
+        '        return 4242\n'
+        '_DEBUG_PREVIEW = _Server()\n'
+    )
+    prelude = module.BootstrapPayload(ns_path, helpers).build(False)
+    namespace = {'RUNS': []}
+    out = io.StringIO()
+    old_stdout = sys.stdout
+    sys.stdout = out
+    try:
+        exec(prelude, namespace)
+        exec(prelude, namespace)
+    finally:
+        sys.stdout = old_stdout
+
+    assert namespace['RUNS'] == [1]
+    assert out.getvalue().count('__IPYBRIDGE_DEBUG_PORT__:4242') == 2
+
+
+def test_parse_preview_address_accepts_port_and_unix_name(kernel_client_module):
+    module = kernel_client_module
+    assert module._parse_preview_address(' 4242\n') == 4242
+    assert module._parse_preview_address('unix:ipybridge_1_ab') == 'unix:ipybridge_1_ab'
+    assert module._parse_preview_address('unix:') is None
+    assert module._parse_preview_address('None') is None
+    assert module._parse_preview_address(0) is None
+
+
+def test_json_helpers_round_trip_non_finite_and_unicode(kernel_client_module):
+    module = kernel_client_module
+    values = module._json_loads('[NaN, "\\u00e9"]')
+    assert values[0] != values[0]
+    assert values[1] == 'é'
+    assert module._json_loads(module._json_dumps({'name': 'é'})) == {'name': 'é'}
+
+
+@pytest.mark.parametrize('backend', ['stdlib', 'orjson'])
+def test_json_encoders_keep_non_finite_floats(backend, monkeypatch, kernel_client_module):
+    module = kernel_client_module
+    if backend == 'orjson':
+        monkeypatch.setattr(module, '_orjson', pytest.importorskip('orjson'))
+    else:
+        monkeypatch.setattr(module, '_orjson', None)
+    payload = {'values': [float('nan'), float('inf'), None], 'ok': True}
+    expected = '{"values":[NaN,Infinity,null],"ok":true}'
+    assert module._json_dumps(payload) == expected
+    assert module._json_line(payload) == (expected + '\n').encode()
+    assert module._json_dumps([None, 1.5]) == '[null,1.5]'
+
+
+def test_unquote_str_repr_matches_literal_eval(kernel_client_module):
+    module = kernel_client_module
+    for value in ['{"a": 1}', "it's", 'tab\there', 'back\\slash', '한글 "q"', '\x00 ']:
+        assert module._unquote_str_repr(repr(value)) == value
+
+
+def test_debug_preview_client_reuses_framed_connection(kernel_client_module):
+    module = kernel_client_module
+    header = module._PREVIEW_FRAME_HEADER
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    accepted = []
+
+    def serve():
+        conn, _ = server.accept()
+        accepted.append(conn)
+        with conn:
+            while True:
+                head = conn.recv(header.size, socket.MSG_WAITALL)
+                if len(head) < header.size:
+                    break
+                (length,) = header.unpack(head)
+                request = json.loads(conn.recv(length, socket.MSG_WAITALL))
+                body = json.dumps({'ok': True, 'data': {'name': request['name']}}).encode()
+                conn.sendall(header.pack(len(body)) + body)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    channel = types.SimpleNamespace(debug_address=server.getsockname()[1])
+    client = module.DebugPreviewClient(channel, DummyLogger())
+    try:
+        assert client.request('a', 5, 5, 0, 0) == (True, {'name': 'a'}, None)
+        assert client.request('b', 5, 5, 0, 0) == (True, {'name': 'b'}, None)
+    finally:
+        client._close()
+        thread.join(timeout=2)
+        server.close()
+    assert len(accepted) == 1
+
+
+def test_debug_preview_client_drops_connection_on_oversized_frame(kernel_client_module):
+    module = kernel_client_module
+    header = module._PREVIEW_FRAME_HEADER
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(2)
+    accepted = []
+
+    def serve():
+        for _ in range(2):
+            conn, _ = server.accept()
+            accepted.append(conn)
+            head = conn.recv(header.size, socket.MSG_WAITALL)
+            (length,) = header.unpack(head)
+            conn.recv(length, socket.MSG_WAITALL)
+            conn.sendall(header.pack(module._PREVIEW_MAX_RESPONSE + 1))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    channel = types.SimpleNamespace(debug_address=server.getsockname()[1])
+    client = module.DebugPreviewClient(channel, DummyLogger())
+    try:
+        ok, data, err = client.request('a', 5, 5, 0, 0)
+    finally:
+        thread.join(timeout=2)
+        for conn in accepted:
+            conn.close()
+        server.close()
+    assert (ok, data) == (False, None)
+    assert 'preview frame too large' in err
+    assert client._sock is None
+    assert len(client._recv_buf) == module._PREVIEW_RECV_SIZE
+
+
+def test_iopub_reader_skips_other_parents_without_decoding(monkeypatch, kernel_client_module):
+    module = kernel_client_module
+    read_fd, write_fd = socket.socketpair()
+    fake_zmq = types.ModuleType('zmq')
+    fake_zmq.FD, fake_zmq.EVENTS, fake_zmq.POLLIN, fake_zmq.NOBLOCK = 1, 2, 1, 1
+
+    class Again(Exception):
+        pass
+
+    fake_zmq.Again = Again
+    monkeypatch.setitem(sys.modules, 'zmq', fake_zmq)
+
+    def frames(parent, text):
+        return [
+            b'sig',
+            json.dumps({'msg_type': 'stream'}).encode(),
+            json.dumps({'msg_id': parent}).encode(),
+            b'{}',
+            json.dumps({'text': text}).encode(),
+        ]
+
+    class FakeSocket:
+        def __init__(self):
+            self.queue = [frames('other', 'skip'), frames('mine', 'keep')]
+
+        def getsockopt(self, opt):
+            if opt == fake_zmq.FD:
+                return read_fd.fileno()
+            return fake_zmq.POLLIN if self.queue else 0
+
+        def recv_multipart(self, flags=0):
+            if not self.queue:
+                raise Again()
+            return self.queue.pop(0)
+
+    class FakeSession:
+        auth = None
+
+        def __init__(self):
+            self.unpacked = []
+
+        def feed_identities(self, msg_list):
+            return [], msg_list
+
+        def unpack(self, data):
+            self.unpacked.append(data)
+            return json.loads(data)
+
+    client = types.SimpleNamespace(
+        iopub_channel=types.SimpleNamespace(socket=FakeSocket()),
+        session=FakeSession(),
+    )
+    try:
+        reader = module.IopubReader(client)
+        msg = reader.get(0.1, 'mine')
+    finally:
+        read_fd.close()
+        write_fd.close()
+
+    assert msg['msg_type'] == 'stream'
+    assert msg['content'] == {'text': 'keep'}
+    assert not any(b'skip' in data for data in client.session.unpacked)
+
+
+def test_request_processor_vars_reuses_filter_json(monkeypatch, kernel_client_module):
+    module = kernel_client_module
+    dumped = []
+    original = module._json_dumps
+
+    def counting_dumps(obj):
+        dumped.append(obj)
+        return original(obj)
+
+    monkeypatch.setattr(module, '_json_dumps', counting_dumps)
+    channel = DummyChannel((True, {}, None))
+    processor = module.RequestProcessor(channel, DummyPreview(None), DummyLogger())
+    args = {'max_repr': 80, 'hide_names': ['_'], 'hide_types': ['module']}
+    processor._handle_vars('1', dict(args))
+    processor._handle_vars('2', json.loads(json.dumps(args)))
+
+    expected = (
+        '__mi_request(\'{"op":"vars","token":null,"max_repr":80,'
+        '"hide_names":["_"],"hide_types":["module"]}\')'
+    )
+    assert channel.calls == [expected, expected]
+    assert dumped == [['_'], ['module']]
+
+
+def test_request_processor_process_stream_reads_bytes(kernel_client_module):
+    module = kernel_client_module
+    processor = module.RequestProcessor(DummyChannel(None), DummyPreview(None), DummyLogger())
+    stream = io.BytesIO(b'\n{"id": "1", "op": "ping"}\nnot json\n{"id": "2", "op": "ping"}')
+    output = io.StringIO()
+    processor.process_stream(stream, output)
+    replies = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [reply['id'] for reply in replies] == ['1', '2']
+    assert all(reply['tag'] == 'pong' for reply in replies)
+
+
+def test_request_processor_pipelines_kernel_calls_up_to_exec(kernel_client_module):
+    module = kernel_client_module
+
+    class PipelineChannel:
+        def __init__(self):
+            self.events = []
+
+        def submit(self, code, user_expression=None):
+            op = json.loads(user_expression[len("__mi_request('"):-2])['op']
+            self.events.append(('submit', op))
+            return op
+
+        def collect(self, pending):
+            self.events.append(('collect', pending))
+            return True, {}, None
+
+        def execute_silent(self, code):
+            self.events.append(('exec', code))
+            return True, None
+
+    channel = PipelineChannel()
+    processor = module.RequestProcessor(channel, DummyPreview(None), DummyLogger())
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b''.join(json.dumps(req).encode() + b'\n' for req in [
+        {'id': '1', 'op': 'vars'},
+        {'id': '2', 'op': 'preview', 'args': {'name': 'df'}},
+        {'id': '3', 'op': 'exec', 'args': {'code': 'x = 1'}},
+        {'id': '4', 'op': 'vars'},
+    ]))
+    os.close(write_fd)
+    with open(read_fd, 'rb') as stream:
+        reader = module.RequestReader(stream)
+        lines = reader.read_batch()
+        assert reader.read_batch() == []
+    responses = list(processor._handle_batch([json.loads(line) for line in lines]))
+
+    assert [response['id'] for response in responses] == ['1', '2', '3', '4']
+    assert channel.events == [
+        ('submit', 'vars'),
+        ('submit', 'preview'),
+        ('collect', 'vars'),
+        ('collect', 'preview'),
+        ('exec', 'x = 1'),
+        ('submit', 'vars'),
+        ('collect', 'vars'),
+    ]
+
+
+def test_request_reader_services_watchers_while_waiting(kernel_client_module):
+    module = kernel_client_module
+    kernel_side, watched = socket.socketpair()
+    watched.setblocking(False)
+    read_fd, write_fd = os.pipe()
+    drained = []
+
+    def on_ready():
+        try:
+            drained.append(watched.recv(64))
+        except BlockingIOError:
+            pass
+
+    def feed():
+        kernel_side.sendall(b'noise')
+        threading.Event().wait(0.05)
+        os.write(write_fd, b'{"id": "1"}\n')
+
+    with open(read_fd, 'rb') as stream:
+        reader = module.RequestReader(stream, [(watched.fileno(), on_ready)])
+        thread = threading.Thread(target=feed)
+        thread.start()
+        lines = reader.read_batch()
+        thread.join()
+    os.close(write_fd)
+    kernel_side.close()
+    watched.close()
+
+    assert lines == [b'{"id": "1"}']
+    assert drained == [b'noise']
+
+
+def test_request_processor_vars_reuses_unchanged_listing(kernel_client_module):
+    module = kernel_client_module
+    listing = {'x': {'type': 'int', 'repr': '1'}}
+    channel = DummyChannel((True, {'token': '3:ab:cd', 'vars': listing}, None))
+    processor = module.RequestProcessor(channel, DummyPreview(None), DummyLogger())
+    first = processor._handle_vars('1', {'max_repr': 80})
+
+    channel.payload = (True, {'token': '3:ab:cd', 'unchanged': True}, None)
+    second = processor._handle_vars('2', {'max_repr': 80})
+
+    assert first['data'] == listing
+    assert second['ok'] is True
+    assert second['data'] == listing
+    assert '"token":null' in channel.calls[0]
+    assert '"token":"3:ab:cd"' in channel.calls[1]
+
+
+@pytest.mark.parametrize('unpacker', ['json', 'pickle'])
+def test_kernel_channel_tunes_session_but_keeps_signing(unpacker, kernel_client_module):
+    module = kernel_client_module
+    original_unpack = json.loads if unpacker == 'json' else pickle.loads
+    session = types.SimpleNamespace(check_pid=True, auth=object(), unpacker=unpacker, unpack=original_unpack)
+
+    class SessionClient(FakeClient):
+        def __init__(self):
+            super().__init__()
+            self.session = session
+
+    channel = module.KernelChannel(lambda: SessionClient(), DummyLogger())
+    channel.connect('conn.json', 'print(1)')
+
+    assert session.check_pid is False
+    assert session.auth is not None
+    if unpacker == 'json' and module._orjson is not None:
+        assert session.unpack is module._json_loads
+    else:
+        assert session.unpack is original_unpack
+
+
+def test_packed_dataframe_preview_expands_to_plain_rows(kernel_client_module, ns_module):
+    pd = pytest.importorskip('pandas')
+    ns_mod = ns_module
+    module = kernel_client_module
+
+    frame = pd.DataFrame({
+        'i': pd.Series([1, -2, 3], dtype='int64'),
+        'f': pd.Series([0.1, float('nan'), float('inf')], dtype='float32'),
+        'b': [True, False, True],
+        'u': pd.Series([1, 2, 255], dtype='uint8'),
+        'n': pd.array([1, None, 3], dtype='Int64'),
+        's': ['x', None, 'z'],
+        't': pd.to_datetime(['2024-01-01', None, '2024-01-03']),
     })
-    assert '__mi_preview' in channel.calls[0]
-    assert response['ok'] is True
-    assert response['data'] == {'name': 'bar'}
+    namespace = {'frame': frame}
+    plain = ns_mod.preview_data('frame', namespace=namespace, max_rows=10, max_cols=10)
+    packed = ns_mod.preview_data('frame', namespace=namespace, max_rows=10, max_cols=10, packed=True)
+
+    assert 'rows' not in packed
+    assert module._expand_packed_preview(json.loads(json.dumps(packed))) == json.loads(json.dumps(plain))
+
+
+def test_packed_ndarray_preview_expands_to_plain_values(kernel_client_module, ns_module):
+    np = pytest.importorskip('numpy')
+    ns_mod = ns_module
+    module = kernel_client_module
+
+    namespace = {
+        'grid': np.arange(24, dtype='>i4').reshape(4, 6),
+        'line': np.array([0.5, np.nan, np.inf], dtype='float32'),
+        'flags': np.array([[True, False]]),
+        'words': np.array(['a', 'b']),
+    }
+    for name in namespace:
+        plain = ns_mod.preview_data(name, namespace=namespace, max_rows=3, max_cols=4, col_offset=1)
+        packed = ns_mod.preview_data(name, namespace=namespace, max_rows=3, max_cols=4, col_offset=1, packed=True)
+        expanded = module._expand_packed_preview(json.loads(json.dumps(packed)))
+        assert json.dumps(expanded, sort_keys=True) == json.dumps(plain, sort_keys=True)
+    assert 'packed_rows' in ns_mod.preview_data('grid', namespace=namespace, packed=True)
+
+
+def test_kernel_channel_skips_log_formatting_when_disabled(kernel_client_module):
+    module = kernel_client_module
+    logger = module.Logger(False)
+    messages = []
+    logger.log = messages.append
+    channel = module.KernelChannel(lambda: FakeClient(), logger)
+    channel.connect('conn.json', 'print(1)')
+    ok, data, _ = channel.run_and_collect('print(42)')
+
+    assert logger.enabled is False
+    assert ok is True and data == {'answer': 42}
+    assert not any(message.startswith(('iopub msg', 'exec len', 'parsing payload')) for message in messages)
+
+
+def test_request_processor_writes_bytes_to_binary_layer(kernel_client_module):
+    module = kernel_client_module
+    processor = module.RequestProcessor(DummyChannel(None), DummyPreview(None), DummyLogger())
+    raw = io.BytesIO()
+    output = io.TextIOWrapper(raw, encoding='utf-8')
+    processor.process_stream(io.BytesIO(b'{"id": "\xc3\xa9", "op": "ping"}\n'), output)
+
+    line = raw.getvalue()
+    assert line.endswith(b'\n') and line.count(b'\n') == 1
+    assert json.loads(line) == {'id': 'é', 'ok': True, 'tag': 'pong'}
+
+
+def test_request_processor_writes_each_batch_once(kernel_client_module):
+    module = kernel_client_module
+    processor = module.RequestProcessor(DummyChannel(None), DummyPreview(None), DummyLogger())
+
+    class CountingSink(io.BytesIO):
+        writes = 0
+
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    raw = CountingSink()
+    output = io.TextIOWrapper(raw, encoding='utf-8')
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'{"id": "1", "op": "ping"}\n{"id": "2", "op": "ping"}\n')
+    os.close(write_fd)
+    with open(read_fd, 'rb') as stream:
+        processor.process_stream(stream, output)
+
+    assert raw.writes == 1
+    assert [json.loads(line)['id'] for line in raw.getvalue().splitlines()] == ['1', '2']
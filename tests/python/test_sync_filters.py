@@ -0,0 +1,26 @@
+import json
+from pathlib import Path
+
+SCRIPT = (Path(__file__).resolve().parents[2] / 'python' / 'sync_filters.py').read_text()
+
+
+def run_sync(args_line=''):
+    calls = []
+    namespace = {
+        '_myipy_sync_var_filters': lambda *args: calls.append(args),
+        '_myipy_set_debug_logging': lambda flag: calls.append(flag),
+    }
+    exec(compile(args_line + SCRIPT, '<sync_filters>', 'exec'), namespace)
+    return calls, namespace
+
+
+def test_sync_filters_reads_quoted_args_and_leaves_no_temporaries():
+    args = json.dumps({'names': ["a'''b", 'x\\'], 'types': ['T'], 'max_repr': 80, 'enable_logs': True})
+    calls, namespace = run_sync('__mi_sync_args = %r\n' % args)
+    assert calls == [(["a'''b", 'x\\'], ['T'], 80), True]
+    assert sorted(namespace) == ['__builtins__', '_myipy_set_debug_logging', '_myipy_sync_var_filters']
+
+
+def test_sync_filters_defaults_without_args_line():
+    calls, _ = run_sync()
+    assert calls == [(None, None, None), False]
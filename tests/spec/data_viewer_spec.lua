@@ -17,11 +17,34 @@ local function record(name, ok, err)
   end
 end
 
+local hooks = { before = {}, after = {} }
+
+local function before_each(fn)
+  table.insert(hooks.before, fn)
+end
+
+local function after_each(fn)
+  table.insert(hooks.after, fn)
+end
+
 local function it(name, fn)
+  for _, hook in ipairs(hooks.before) do hook() end
   local ok, err = pcall(fn)
+  for _, hook in ipairs(hooks.after) do hook() end
   record(name, ok, err)
 end
 
+-- Specs swap in a fake global vim (and may set vim.NIL); put the real one back.
+local saved_vim, saved_nil
+before_each(function()
+  saved_vim = _G.vim
+  saved_nil = type(saved_vim) == 'table' and saved_vim.NIL or nil
+end)
+after_each(function()
+  _G.vim = saved_vim
+  if type(saved_vim) == 'table' then saved_vim.NIL = saved_nil end
+end)
+
 local function fake_env()
   local env = {
     buffers = {},
@@ -146,6 +169,25 @@ it('on_preview renders dataframe payload into buffer', function()
   assert(viewer._line2path[4] == nil, 'dataframe header should not register drilldown path')
 end)
 
+it('on_preview renders null cells blank', function()
+  local viewer, _, buf_lines = fake_env()
+  vim.NIL = setmetatable({}, { __tostring = function() return 'vim.NIL' end })
+  viewer.on_preview({
+    name = 'df',
+    kind = 'dataframe',
+    total_shape = { 1, 2 },
+    row_offset = 0,
+    col_offset = 0,
+    rows = {
+      { 'a', vim.NIL },
+    },
+    columns = { 'x', 'y' },
+  })
+  for _, line in ipairs(buf_lines(viewer.buf)) do
+    assert(not line:find('vim.NIL', 1, true), 'null cell should render blank')
+  end
+end)
+
 it('move_rows via keymap requests next window', function()
   local viewer, env = fake_env()
   viewer.on_preview({